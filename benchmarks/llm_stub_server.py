@@ -0,0 +1,244 @@
+"""Local OpenAI-compatible stand-in for Groq/OpenAI, for offline runs.
+
+Serves chat completions (plain and streamed as server-sent events) and
+audio transcriptions under both /v1 and /openai/v1, with scriptable
+latency, token rate, error and 429 injection. Point the app at it with:
+
+    python -m benchmarks.llm_stub_server --port 8808 --latency 0.3 --tokens-per-second 80
+    GROQ_BASE_URL=http://127.0.0.1:8808/openai/v1 GROQ_API_KEY=stub \\
+    OPENAI_BASE_URL=http://127.0.0.1:8808/v1 OPENAI_API_KEY=stub streamlit run app.py
+
+Settings can be changed while it runs by POSTing JSON to /_stub/config
+(e.g. {"error_rate": 0.2}); GET /_stub/stats returns request counters.
+Only the standard library is used.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "Under the Land Use Act the Governor holds land in trust for the use and common "
+    "benefit of all Nigerians and a statutory right of occupancy may be revoked for "
+    "overriding public interest subject to compensation as provided in section 29"
+).split()
+
+
+class StubConfig:
+    """Behaviour knobs; every field can be set from the CLI or /_stub/config."""
+
+    def __init__(self, latency=0.2, jitter=0.0, tokens_per_second=100.0, response_tokens=200,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, rpm=0,
+                 transcription_latency=0.5):
+        self.latency = latency                      # seconds before the first byte
+        self.jitter = jitter                        # +/- uniform seconds added to latency
+        self.tokens_per_second = tokens_per_second  # streaming/generation speed
+        self.response_tokens = response_tokens      # answer length, capped by max_tokens
+        self.error_rate = error_rate                # fraction of requests answered 500
+        self.rate_limit_rate = rate_limit_rate      # fraction of requests answered 429
+        self.retry_after = retry_after              # retry-after header on 429s
+        self.rpm = rpm                              # real per-minute limit (0 = none)
+        self.transcription_latency = transcription_latency
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "completions": 0, "streams": 0, "transcriptions": 0,
+                      "errors_injected": 0, "rate_limited": 0, "tokens": 0}
+        self._window = []
+
+    def update(self, values):
+        with self.lock:
+            for name, value in values.items():
+                if name.startswith("_") or name in ("lock", "stats") or not hasattr(self, name):
+                    raise KeyError(name)
+                setattr(self, name, type(getattr(self, name))(value))
+
+    def as_dict(self):
+        return {name: value for name, value in vars(self).items()
+                if not name.startswith("_") and name not in ("lock", "stats")}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def admit(self):
+        """Return None to serve the request, or (status, message) to reject it."""
+        with self.lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            if self.rpm:
+                self._window = [t for t in self._window if now - t < 60]
+                if len(self._window) >= self.rpm:
+                    self.stats["rate_limited"] += 1
+                    return 429, "Rate limit reached for requests"
+                self._window.append(now)
+            roll = random.random()
+            if roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429, "Rate limit reached for requests"
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.stats["errors_injected"] += 1
+                return 500, "Injected server error"
+        return None
+
+    def first_byte_delay(self, base):
+        return max(0.0, base + random.uniform(-self.jitter, self.jitter))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    config = None
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        headers = {"retry-after": f"{self.config.retry_after:g}"} if status == 429 else None
+        self._send_json(status, {"error": {"message": message, "type": "stub_error"}}, headers)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/_stub/stats":
+            with self.config.lock:
+                stats = dict(self.config.stats)
+            self._send_json(200, stats)
+        elif self.path.rstrip("/") == "/_stub/config":
+            self._send_json(200, self.config.as_dict())
+        else:
+            self._send_error(404, f"No route for GET {self.path}")
+
+    def do_POST(self):
+        body = self._body()
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/_stub/config":
+            try:
+                self.config.update(json.loads(body or b"{}"))
+            except (KeyError, ValueError, TypeError) as e:
+                self._send_error(400, f"Bad setting: {e}")
+                return
+            self._send_json(200, self.config.as_dict())
+        elif path in ("/v1/chat/completions", "/openai/v1/chat/completions"):
+            self._chat(json.loads(body or b"{}"))
+        elif path in ("/v1/audio/transcriptions", "/openai/v1/audio/transcriptions"):
+            self._transcribe(body)
+        else:
+            self._send_error(404, f"No route for POST {self.path}")
+
+    def _answer_words(self, max_tokens):
+        n = max(1, min(self.config.response_tokens, max_tokens or self.config.response_tokens))
+        return [WORDS[i % len(WORDS)] for i in range(n)]
+
+    def _chat(self, request):
+        rejection = self.config.admit()
+        time.sleep(self.config.first_byte_delay(self.config.latency))
+        if rejection:
+            self._send_error(*rejection)
+            return
+        words = self._answer_words(request.get("max_tokens"))
+        model = request.get("model", "stub")
+        created = int(time.time())
+        self.config.count("tokens", len(words))
+        per_token = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+
+        if not request.get("stream"):
+            self.config.count("completions")
+            time.sleep(per_token * len(words))
+            self._send_json(200, {
+                "id": f"stub-{created}", "object": "chat.completion", "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(words),
+                          "total_tokens": len(words)},
+            })
+            return
+
+        self.config.count("streams")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            if per_token:
+                time.sleep(per_token)
+            event = {"id": f"stub-{created}", "object": "chat.completion.chunk", "created": created,
+                     "model": model,
+                     "choices": [{"index": 0, "delta": {"content": (" " if i else "") + word},
+                                  "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        final = {"id": f"stub-{created}", "object": "chat.completion.chunk", "created": created,
+                 "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self._write_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _transcribe(self, body):
+        rejection = self.config.admit()
+        time.sleep(self.config.first_byte_delay(self.config.transcription_latency))
+        if rejection:
+            self._send_error(*rejection)
+            return
+        self.config.count("transcriptions")
+        self._send_json(200, {"text": f"Stub transcription of {len(body)} bytes of audio: "
+                                      + " ".join(WORDS[:20])})
+
+
+def make_server(host="127.0.0.1", port=8808, config=None):
+    """Build (but do not start) a stub server; handy for in-process benchmarks."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    defaults = StubConfig()
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible LLM stub.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency", type=float, default=defaults.latency,
+                        help="seconds before the first byte of each response")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--response-tokens", type=int, default=defaults.response_tokens)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate,
+                        help="fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate,
+                        help="fraction of requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--rpm", type=int, default=defaults.rpm,
+                        help="enforce a real requests-per-minute limit (0 disables)")
+    parser.add_argument("--transcription-latency", type=float, default=defaults.transcription_latency)
+    parser.add_argument("--seed", type=int, help="seed the error/429 injection")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    config = StubConfig(args.latency, args.jitter, args.tokens_per_second, args.response_tokens,
+                        args.error_rate, args.rate_limit_rate, args.retry_after, args.rpm,
+                        args.transcription_latency)
+    server = make_server(args.host, args.port, config)
+    print(f"LLM stub listening on http://{args.host}:{args.port} (/v1 and /openai/v1)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,412 @@
+"""Concurrent-session load test for one app instance.
+
+Streamlit runs every browser session's script in its own thread of a
+single server process, and a page does its embedding, SQL and LLM work
+synchronously in that thread. This harness does the same: each simulated
+session is a thread with its own ConversationMemory, working through a
+random mix of chat questions, law searches and document reviews, with
+think time in between. It calls the same functions the pages call.
+The LLM is benchmarks/llm_stub_server.py, started in-process unless
+--llm-url is given. The database is DATABASE_URL, and the corpus should
+already be ingested (see benchmarks.retrieval_benchmark --ingest).
+
+    python -m benchmarks.load_test --sessions 5,10,25,50
+    python -m benchmarks.load_test --sessions 20 --llm-latency 0.8 --llm-error-rate 0.02
+
+Each concurrency level reports:
+- throughput
+- latency and time-to-first-token percentiles per action
+- error rates
+- RSS growth per session
+
+The highest level whose chat p95 and error rate meet --slo-p95 and
+--max-error-rate is printed as the capacity of one instance. The full
+report is written as JSON.
+
+The pages import utils.auth, which initialises the Firebase Admin SDK at
+import time, so FIREBASE_SERVICE_ACCOUNT_PATH (in the environment or
+.env) must name a service account file, as for the app itself. No
+Firebase calls are made during the run.
+
+Chat turns are logged as the user "loadtest"; --cleanup deletes those
+rows afterwards. The response cache goes to a temporary file so the
+real one is neither read nor polluted.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from benchmarks.retrieval_benchmark import percentile, load_questions, RESULTS_DIR
+from benchmarks.llm_stub_server import StubConfig, make_server
+
+LOAD_TEST_USER = "loadtest"
+
+FOLLOW_UPS = [
+    "Can you explain that in simpler terms?",
+    "Which section of the law says that?",
+    "What are the penalties if this is breached?",
+    "Does this also apply to companies?",
+]
+LAW_QUERIES = [
+    "Section 33 of the Constitution right to life",
+    "EFCC Act interim forfeiture of assets",
+    "Land Use Act revocation of right of occupancy",
+    "Marriage Act caveat against a marriage",
+    "NDLEA Act penalties for drug trafficking",
+    "BOFIA 2020 licensing of banks",
+    "Cybercrimes Act 2015 identity theft",
+    "CAMA 2020 duties of company directors",
+]
+ACTIONS = ("chat", "law_search", "review")
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource  # peak rather than current RSS outside Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def parse_mix(text):
+    """Parse "chat=6,law_search=3,review=1" into relative weights per action."""
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"unknown action {name!r}; choose from {', '.join(ACTIONS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class Workload:
+    """The page functions a session calls. The pages are imported here, after
+    the LLM settings are in the environment (the client reads them at import)."""
+
+    def __init__(self, review_text):
+        from modules import chat_assistant, law_search, document_reviewer
+
+        self.chat_page = chat_assistant
+        self.search_page = law_search
+        self.review_page = document_reviewer
+        self.questions = [q["question"] for q in load_questions()]
+        self.review_text = review_text
+
+    def new_memory(self):
+        return self.chat_page.ConversationMemory(self.chat_page.SYSTEM_PROMPT)
+
+    def chat(self, session, on_first):
+        """One Ask click in chat_interface, minus the rendering."""
+        question = (session.rng.choice(FOLLOW_UPS) if len(session.memory) and session.rng.random() < 0.5
+                    else session.rng.choice(self.questions))
+        _, _, from_cache = self.chat_page.answer_question(
+            session.memory, question, LOAD_TEST_USER, lambda pieces: _consume(pieces, on_first))
+        if from_cache:
+            on_first()  # nothing streamed; the whole answer arrived at once
+
+    def law_search(self, session, on_first):
+        page = self.search_page
+        _consume(page.cached_stream_chat_completion(
+            "law_search", page.law_search_messages(session.rng.choice(LAW_QUERIES)),
+            temperature=0.2, max_tokens=500, fallback_model="gpt-3.5-turbo"), on_first)
+
+    def review(self, session, on_first):
+        page = self.review_page
+        if page.count_tokens(self.review_text) > page.REVIEW_SECTION_TOKENS:
+            stream = page.stream_map_reduce_review(self.review_text)
+        else:
+            stream = page.stream_review(self.review_text)
+        _consume(stream, on_first)
+
+
+def _consume(stream, on_first):
+    pieces = []
+    for piece in stream:
+        if not pieces:
+            on_first()
+        pieces.append(piece)
+    return "".join(pieces)
+
+
+class Session:
+    def __init__(self, index, seed, workload):
+        self.index = index
+        self.rng = random.Random(seed)
+        self.memory = workload.new_memory()
+
+    def state_bytes(self):
+        """Approximate size of what this session keeps in st.session_state."""
+        memory = self.memory
+        text = sum(len(q) + len(a) for q, a, _ in memory.verbatim_exchanges())
+        return text + len(memory.summary) + 8 * len(memory.offloaded_ids)
+
+
+def run_session(session, workload, actions, mix, think_time, delay, records):
+    time.sleep(delay)
+    kinds, weights = zip(*mix.items())
+    for n in range(actions):
+        if n:
+            time.sleep(session.rng.expovariate(1 / think_time) if think_time > 0 else 0)
+        kind = session.rng.choices(kinds, weights)[0]
+        started = time.perf_counter()
+        first = []
+
+        def on_first():
+            if not first:
+                first.append(time.perf_counter())
+
+        error = None
+        try:
+            getattr(workload, kind)(session, on_first)
+        except Exception as e:  # the page would show st.error and carry on
+            error = f"{type(e).__name__}: {str(e)[:120]}"
+        finished = time.perf_counter()
+        records.append({
+            "session": session.index, "action": kind, "latency": finished - started,
+            "first_token": first[0] - started if first else None, "error": error,
+        })
+
+
+def _seconds(samples):
+    return {
+        "p50": _round(percentile(samples, 50)), "p95": _round(percentile(samples, 95)),
+        "p99": _round(percentile(samples, 99)), "max": _round(max(samples) if samples else None),
+    }
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+def summarize_level(n_sessions, records, wall, rss_growth, state_bytes):
+    errors = [r for r in records if r["error"]]
+    by_action = {}
+    for kind in ACTIONS:
+        rows = [r for r in records if r["action"] == kind]
+        if not rows:
+            continue
+        ok = [r for r in rows if not r["error"]]
+        by_action[kind] = {
+            "count": len(rows),
+            "errors": len(rows) - len(ok),
+            "error_rate": round((len(rows) - len(ok)) / len(rows), 4),
+            "throughput_per_s": round(len(ok) / wall, 3),
+            "latency_s": _seconds([r["latency"] for r in ok]),
+            "first_token_s": _seconds([r["first_token"] for r in ok if r["first_token"] is not None]),
+        }
+    return {
+        "sessions": n_sessions,
+        "wall_s": round(wall, 2),
+        "actions": len(records),
+        "throughput_per_s": round((len(records) - len(errors)) / wall, 3),
+        "error_rate": round(len(errors) / len(records), 4) if records else 0.0,
+        "rss_growth_mb": round(rss_growth / 2 ** 20, 2),
+        "rss_growth_per_session_kb": round(rss_growth / n_sessions / 1024, 1),
+        "session_state_kb": round(state_bytes / 1024, 1),
+        "by_action": by_action,
+        "top_errors": dict(Counter(r["error"] for r in errors).most_common(5)),
+    }
+
+
+def run_level(n_sessions, workload, args, seed):
+    from utils.log_writer import get_log_writer
+
+    gc.collect()
+    rss_before = rss_bytes()
+    sessions = [Session(i, seed * 100003 + i, workload) for i in range(n_sessions)]
+    records = []  # list.append is atomic; one dict per finished action
+    threads = [
+        threading.Thread(target=run_session, name=f"session-{s.index}", daemon=True,
+                         args=(s, workload, args.actions, args.mix, args.think_time,
+                               args.ramp_up * s.index / n_sessions, records))
+        for s in sessions
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    get_log_writer().flush(timeout=60)
+    # Measured while the sessions (and their memories) are still referenced
+    gc.collect()
+    rss_growth = max(0, rss_bytes() - rss_before)
+    state_bytes = sum(s.state_bytes() for s in sessions) / n_sessions
+    return summarize_level(n_sessions, records, wall, rss_growth, state_bytes)
+
+
+def meets_slo(level, slo_p95, max_error_rate):
+    chat = level["by_action"].get("chat")
+    chat_ok = chat is None or (chat["latency_s"]["p95"] is not None and chat["latency_s"]["p95"] <= slo_p95)
+    return chat_ok and level["error_rate"] <= max_error_rate
+
+
+def print_level(level):
+    def p(kind, pct="p95"):
+        stats = level["by_action"].get(kind)
+        value = stats and stats["latency_s"][pct]
+        return f"{value:6.2f}" if value is not None else "     -"
+
+    print(f"{level['sessions']:>8} {level['actions']:>7} {level['throughput_per_s']:>7.2f} "
+          f"{level['error_rate']:>6.1%}   {p('chat', 'p50')} {p('chat')} {p('chat', 'p99')}   "
+          f"{p('law_search')} {p('review')}   {level['rss_growth_per_session_kb']:>9.0f}")
+
+
+def cleanup():
+    """Delete everything logged by the load-test user."""
+    import sqlalchemy as sa
+    from config.database import SessionLocal
+
+    with SessionLocal() as db:
+        ids = "SELECT id FROM queries WHERE user_id = :user"
+        db.execute(sa.text(f"DELETE FROM query_embeddings WHERE query_id IN ({ids})"), {"user": LOAD_TEST_USER})
+        db.execute(sa.text(f"DELETE FROM feedback WHERE query_id IN ({ids}) OR user_id = :user"),
+                   {"user": LOAD_TEST_USER})
+        deleted = db.execute(sa.text("DELETE FROM queries WHERE user_id = :user"), {"user": LOAD_TEST_USER}).rowcount
+        db.commit()
+    return deleted
+
+
+def ensure_user():
+    from config.database import SessionLocal
+    from models.database_models import User
+
+    with SessionLocal() as db:
+        if db.get(User, LOAD_TEST_USER) is None:
+            db.add(User(id=LOAD_TEST_USER, email="loadtest@localhost", full_name="Load test"))
+            db.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test chat, law search and document review with concurrent sessions.")
+    parser.add_argument("--sessions", default="5,10,25",
+                        help="comma-separated concurrency levels, run in order")
+    parser.add_argument("--actions", type=int, default=6, help="actions per session")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=6,law_search=3,review=1"),
+                        help="relative weights of chat, law_search and review")
+    parser.add_argument("--think-time", type=float, default=3.0,
+                        help="mean seconds between a session's actions (exponential)")
+    parser.add_argument("--ramp-up", type=float, default=5.0,
+                        help="seconds over which a level's sessions start")
+    parser.add_argument("--review-document", default="data/legal_pdfs/marriage_act.pdf")
+    parser.add_argument("--review-tokens", type=int, default=8000,
+                        help="truncate the reviewed document to about this many tokens")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--llm-url", help="use an already running stub (or other endpoint) at this URL")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="stub seconds to first byte")
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--llm-response-tokens", type=int, default=200)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rpm", type=float, default=100000,
+                        help="client-side requests/minute per provider (the app default for Groq is 30)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="disable the answer and response caches")
+    parser.add_argument("--slo-p95", type=float, default=15.0, help="chat p95 latency target in seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--output", help="report file (default: benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--cleanup", action="store_true",
+                        help="delete the load-test user's logged queries afterwards")
+    args = parser.parse_args()
+    levels = [int(n) for n in args.sessions.split(",")]
+
+    load_dotenv()  # as utils.auth does, so its Firebase setup finds the same settings
+    firebase_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH")
+    if not (firebase_path and os.path.exists(firebase_path)):
+        parser.error("FIREBASE_SERVICE_ACCOUNT_PATH must name a Firebase service account file; "
+                     "the pages initialise Firebase when they are imported")
+    random.seed(args.seed)  # the stub's error injection
+
+    stub = None
+    if args.llm_url:
+        llm_url = args.llm_url.rstrip("/")
+        os.environ.setdefault("GROQ_API_KEY", "stub")
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+    else:
+        stub = StubConfig(latency=args.llm_latency, jitter=args.llm_jitter,
+                          tokens_per_second=args.llm_tokens_per_second,
+                          response_tokens=args.llm_response_tokens, error_rate=args.llm_error_rate)
+        server = make_server("127.0.0.1", 0, stub)
+        threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+        llm_url = f"http://127.0.0.1:{server.server_address[1]}"
+        os.environ["GROQ_API_KEY"] = os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["GROQ_BASE_URL"] = f"{llm_url}/openai/v1"
+    os.environ["OPENAI_BASE_URL"] = f"{llm_url}/v1"
+    os.environ["GROQ_RPM"] = os.environ["OPENAI_RPM"] = str(args.llm_rpm)
+    os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "response_cache.db"))
+    if args.no_cache:
+        os.environ["ANSWER_CACHE_ENABLED"] = os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+
+    from utils.text_extract import extract_text_from_pdf
+    from utils.tokens import split_by_tokens
+    from utils.vector_db import warm_up
+    from utils.llm_client import provider_stats
+    from utils.singleflight import coalescing_stats
+    from utils.log_writer import get_log_writer
+
+    review_text = split_by_tokens(extract_text_from_pdf(args.review_document), args.review_tokens)[0]
+    workload = Workload(review_text)
+    ensure_user()
+    print(f"LLM at {llm_url}; warming up...")
+    warm_up()
+    warm_session = Session(-1, args.seed, workload)
+    for kind in args.mix:  # load the model, open pools and fill lazy caches before measuring
+        getattr(workload, kind)(warm_session, lambda: None)
+    get_log_writer().flush(timeout=60)
+
+    print(f"\n{'sessions':>8} {'actions':>7} {'ok/s':>7} {'errors':>6}   "
+          f"{'chat p50/p95/p99 (s)':<20}   {'search':>6} {'review':>6}   {'RSS/sess KB':>9}")
+    results = []
+    for i, n_sessions in enumerate(levels):
+        level = run_level(n_sessions, workload, args, args.seed + i)
+        level["llm"] = provider_stats()
+        level["coalescing"] = coalescing_stats()
+        level["log_writer"] = get_log_writer().stats()
+        if stub is not None:
+            with stub.lock:
+                level["stub"] = dict(stub.stats)
+        level["meets_slo"] = meets_slo(level, args.slo_p95, args.max_error_rate)
+        results.append(level)
+        print_level(level)
+        if level["top_errors"]:
+            for error, count in level["top_errors"].items():
+                print(f"{'':>10}{count} x {error}")
+
+    passing = [level["sessions"] for level in results if level["meets_slo"]]
+    capacity = max(passing) if passing else 0
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "settings": {
+            "levels": levels, "actions": args.actions, "mix": args.mix, "think_time": args.think_time,
+            "ramp_up": args.ramp_up, "review_document": args.review_document,
+            "review_tokens": args.review_tokens, "seed": args.seed, "llm_url": args.llm_url,
+            "stub": stub.as_dict() if stub is not None else None, "llm_rpm": args.llm_rpm,
+            "caches": not args.no_cache, "slo_p95": args.slo_p95, "max_error_rate": args.max_error_rate,
+            "cpu_count": os.cpu_count(),
+        },
+        "levels": results,
+        "capacity_sessions": capacity,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if capacity:
+        print(f"\nCapacity: {capacity} concurrent sessions per instance meet chat p95 <= {args.slo_p95:g}s "
+              f"and errors <= {args.max_error_rate:.0%}")
+    else:
+        print(f"\nNo level met chat p95 <= {args.slo_p95:g}s and errors <= {args.max_error_rate:.0%}")
+    print(f"Report written to {output}")
+    if args.cleanup:
+        print(f"Deleted {cleanup()} load-test queries")
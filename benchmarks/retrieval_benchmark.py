@@ -0,0 +1,224 @@
+"""Retrieval benchmark over the bundled legal corpus.
+
+Runs the golden questions in benchmarks/golden_questions.json through
+search_chunks and reports recall@k, MRR and retrieval latency
+percentiles, then writes everything (settings, summary and per-question
+ranks) to a JSON file so runs can be compared:
+
+    python -m benchmarks.retrieval_benchmark --ingest
+    python -m benchmarks.retrieval_benchmark --backend faiss --ingest
+    python -m benchmarks.retrieval_benchmark --mode hybrid --baseline benchmarks/results/before.json
+
+A retrieved chunk is relevant when it comes from one of the question's
+source files and contains one of its expected phrases. Phrases are
+compared with all whitespace removed and case folded, because the PDF
+text layer splits words ("C hairman a nd me mbers") and mixes in
+non-breaking spaces. recall@k is the fraction of questions with a
+relevant chunk in the top k; MRR uses the rank of the first one.
+
+Latency is measured around search_chunks with the query-embedding cache
+cleared before every call, so it includes encoding the question.
+--min-recall, --min-mrr, --max-p95-ms and --baseline make the run exit
+non-zero on a regression, for gating retrieval and chunking changes.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+from datetime import datetime, timezone
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "golden_questions.json")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+RECALL_CUTOFFS = (1, 3, 5, 10)
+
+
+def percentile(samples, pct):
+    """Nearest-rank `pct` percentile of `samples`, or None when empty."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))  # ceil without floats
+    return ordered[int(rank) - 1]
+
+
+def _squash(text):
+    return re.sub(r"\s+", "", text).casefold()
+
+
+def load_questions(path=GOLDEN_PATH):
+    with open(path, encoding="utf-8") as f:
+        questions = json.load(f)
+    for q in questions:
+        q["_phrases"] = [_squash(p) for p in q["expected_phrases"]]
+    return questions
+
+
+def is_relevant(question, text, source):
+    if os.path.basename(source or "") not in question["sources"]:
+        return False
+    squashed = _squash(text)
+    return any(phrase in squashed for phrase in question["_phrases"])
+
+
+def first_relevant_rank(question, rows):
+    """1-based rank of the first relevant (id, text, source) row, or None."""
+    for rank, (_, text, source) in enumerate(rows, start=1):
+        if is_relevant(question, text, source):
+            return rank
+    return None
+
+
+def summarize(ranks, latencies_ms, k):
+    """Aggregate metrics from per-question ranks and all latency samples."""
+    n = len(ranks)
+    summary = {"questions": n}
+    for cutoff in sorted({c for c in RECALL_CUTOFFS if c <= k} | {k}):
+        summary[f"recall@{cutoff}"] = round(
+            sum(1 for r in ranks if r is not None and r <= cutoff) / n, 4) if n else 0.0
+    summary["mrr"] = round(sum(1.0 / r for r in ranks if r is not None) / n, 4) if n else 0.0
+    summary["latency_ms"] = {
+        "p50": percentile(latencies_ms, 50),
+        "p95": percentile(latencies_ms, 95),
+        "p99": percentile(latencies_ms, 99),
+        "mean": round(statistics.fmean(latencies_ms), 3) if latencies_ms else None,
+        "samples": len(latencies_ms),
+    }
+    return summary
+
+
+def run(questions, k, backend, mode, ef_search, probes, repeat):
+    from utils.vector_db import search_chunks, clear_query_cache
+
+    # Load the model and open connections before anything is timed
+    search_chunks(questions[0]["question"], k=k, ef_search=ef_search, probes=probes,
+                  backend=backend, mode=mode)
+    results, latencies = [], []
+    for q in questions:
+        samples = []
+        for _ in range(repeat):
+            clear_query_cache()
+            started = time.perf_counter()
+            rows = search_chunks(q["question"], k=k, ef_search=ef_search, probes=probes,
+                                 backend=backend, mode=mode)
+            samples.append(round((time.perf_counter() - started) * 1000, 3))
+        latencies += samples
+        rank = first_relevant_rank(q, rows)
+        results.append({
+            "id": q["id"],
+            "section": q["section"],
+            "rank": rank,
+            "latency_ms": percentile(samples, 50),
+            "retrieved": [{"id": row[0], "source": os.path.basename(row[2] or "")} for row in rows],
+        })
+        mark = f"rank {rank}" if rank else "MISS"
+        print(f"  {q['id']:<40} {mark:>8}  {percentile(samples, 50):8.1f} ms")
+    return results, latencies
+
+
+def compare(summary, baseline, tolerance):
+    """Print deltas against a previous run; return the metrics that regressed."""
+    regressions = []
+    for name, value in summary.items():
+        if not (name.startswith("recall@") or name == "mrr") or name not in baseline:
+            continue
+        delta = value - baseline[name]
+        print(f"  {name:<10} {baseline[name]:.4f} -> {value:.4f} ({delta:+.4f})")
+        if delta < -tolerance:
+            regressions.append(name)
+    for pct in ("p50", "p95", "p99"):
+        before, after = baseline.get("latency_ms", {}).get(pct), summary["latency_ms"][pct]
+        if before and after:
+            print(f"  {pct + ' ms':<10} {before:.1f} -> {after:.1f} ({(after - before) / before:+.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency on golden questions.")
+    parser.add_argument("--questions", default=GOLDEN_PATH)
+    parser.add_argument("--k", type=int, default=5, help="chunks retrieved per question")
+    parser.add_argument("--backend", choices=["pgvector", "faiss"],
+                        help="defaults to RETRIEVAL_BACKEND")
+    parser.add_argument("--mode", choices=["vector", "hybrid"], help="defaults to RETRIEVAL_MODE")
+    parser.add_argument("--ef-search", type=int, help="HNSW ef_search for this run")
+    parser.add_argument("--probes", type=int, help="IVFFlat probes / FAISS nprobe for this run")
+    parser.add_argument("--repeat", type=int, default=3, help="timed searches per question")
+    parser.add_argument("--ingest", action="store_true",
+                        help="sync --folder into legal_chunks first (and export FAISS for --backend faiss)")
+    parser.add_argument("--folder", default="data/legal_pdfs")
+    parser.add_argument("--force", action="store_true",
+                        help="with --ingest, re-chunk and re-embed every file (after a chunking change)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/retrieval-<timestamp>.json)")
+    parser.add_argument("--baseline", help="previous result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="allowed drop in recall/MRR versus --baseline")
+    parser.add_argument("--min-recall", type=float, help="fail if recall@k is below this")
+    parser.add_argument("--min-mrr", type=float, help="fail if MRR is below this")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if p95 latency is above this")
+    args = parser.parse_args()
+
+    from utils.vector_db import (
+        corpus_version, RETRIEVAL_BACKEND, RETRIEVAL_MODE, EMBEDDING_MODEL_NAME,
+        EMBEDDING_ENGINE, EMBEDDING_STORAGE, VECTOR_INDEX_METHOD
+    )
+    backend = args.backend or RETRIEVAL_BACKEND
+    mode = args.mode or RETRIEVAL_MODE
+
+    if args.ingest:
+        from utils.data_ingest import sync_folder
+        changed, _, removed, _, _ = sync_folder(args.folder, force=args.force)
+        # sync_folder only exports when the corpus changed and FAISS is the default backend
+        if backend == "faiss" and not (RETRIEVAL_BACKEND == "faiss" and (changed or removed)):
+            from utils.faiss_index import export_faiss_index
+            print(f"Exported {export_faiss_index()} chunks to the FAISS index")
+
+    questions = load_questions(args.questions)
+    print(f"Running {len(questions)} questions: backend={backend} mode={mode} k={args.k}")
+    results, latencies = run(questions, args.k, backend, mode, args.ef_search, args.probes,
+                             args.repeat)
+    summary = summarize([r["rank"] for r in results], latencies, args.k)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "settings": {
+            "backend": backend, "mode": mode, "k": args.k, "ef_search": args.ef_search,
+            "probes": args.probes, "repeat": args.repeat, "questions_file": args.questions,
+            "embedding_model": EMBEDDING_MODEL_NAME, "embedding_engine": EMBEDDING_ENGINE,
+            "embedding_storage": EMBEDDING_STORAGE, "vector_index": VECTOR_INDEX_METHOD,
+            "corpus_version": corpus_version(max_age=0),
+        },
+        "summary": summary,
+        "questions": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"retrieval-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    latency = summary["latency_ms"]
+    recalls = "  ".join(f"{name}={value:.3f}" for name, value in summary.items()
+                        if name.startswith("recall@"))
+    print(f"\n{recalls}  MRR={summary['mrr']:.3f}")
+    print(f"latency p50={latency['p50']:.1f} ms  p95={latency['p95']:.1f} ms  "
+          f"p99={latency['p99']:.1f} ms  ({latency['samples']} searches)")
+    print(f"Results written to {output}")
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline}:")
+        failures += [f"{name} regressed" for name in
+                     compare(summary, baseline["summary"], args.tolerance)]
+    if args.min_recall is not None and summary[f"recall@{args.k}"] < args.min_recall:
+        failures.append(f"recall@{args.k} below {args.min_recall}")
+    if args.min_mrr is not None and summary["mrr"] < args.min_mrr:
+        failures.append(f"MRR below {args.min_mrr}")
+    if args.max_p95_ms is not None and latency["p95"] > args.max_p95_ms:
+        failures.append(f"p95 latency above {args.max_p95_ms} ms")
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
@@ -1,7 +1,7 @@
 from config.database import Base, engine
-from models.database_models import User, Query, Feedback
+from models.database_models import User, Query, Feedback, QueryEmbedding
 
 if __name__ == "__main__":
-    print("Creating all tables (users, Query, Feedback) in the database...")
+    print("Creating all tables (users, Query, Feedback, query_embeddings) in the database...")
     Base.metadata.create_all(engine)
     print("All tables created successfully!")
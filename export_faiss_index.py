@@ -0,0 +1,12 @@
+import argparse
+from utils.faiss_index import export_faiss_index, FAISS_INDEX_DIR
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Snapshot legal_chunks from Postgres into the FAISS retrieval index.")
+    parser.add_argument("--index-dir", default=FAISS_INDEX_DIR)
+    args = parser.parse_args()
+
+    print("Exporting legal_chunks to FAISS...")
+    count = export_faiss_index(args.index_dir)
+    print(f"Exported {count} chunks to {args.index_dir}")
@@ -0,0 +1,38 @@
+import time
+import argparse
+from utils.onnx_encoder import (
+    OnnxSentenceEncoder, export_onnx, check_parity, ONNX_MODEL_DIR, EMBEDDING_THREADS
+)
+from utils.vector_db import EMBEDDING_MODEL_NAME
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the embedding model to ONNX and check it against SentenceTransformer.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 copy")
+    parser.add_argument("--threads", type=int, default=EMBEDDING_THREADS)
+    parser.add_argument("--min-cosine", type=float, default=0.99,
+                        help="parity tolerance against the PyTorch model")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    print(f"Exporting {args.model} to {args.model_dir}...")
+    export_onnx(args.model, args.model_dir, quantize=not args.no_quantize)
+
+    reference = SentenceTransformer(args.model, device="cpu")
+    variants = [False] if args.no_quantize else [False, True]
+    failed = False
+    for quantized in variants:
+        encoder = OnnxSentenceEncoder(args.model_dir, quantized=quantized, threads=args.threads)
+        ok, worst = check_parity(reference, encoder, min_cosine=args.min_cosine)
+        started = time.perf_counter()
+        encoder.encode(["What are the rights of tenants under the Land Use Act?"] * 64)
+        elapsed = (time.perf_counter() - started) * 1000
+        label = "int8" if quantized else "fp32"
+        print(f"{label}: worst cosine {worst:.4f} ({'OK' if ok else 'FAILED'}), "
+              f"64 sentences in {elapsed:.0f} ms")
+        failed = failed or not ok
+    if failed:
+        raise SystemExit("Parity check failed; keep EMBEDDING_ENGINE=torch or use --no-quantize.")
+    print("Export complete! Set EMBEDDING_ENGINE=onnx to use it.")
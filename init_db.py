@@ -1,8 +1,12 @@
+from sqlalchemy import text
 from config.database import engine
 from models.database_models import Base
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # Columns added after the tables were first created
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE queries ADD COLUMN IF NOT EXISTS trace TEXT"))
 
 if __name__ == "__main__":
     print("Creating database tables...")
@@ -0,0 +1,33 @@
+import sys
+import argparse
+from utils.vector_db import (
+    create_tables, migrate_to_half_storage, rebuild_vector_index,
+    drop_full_vector_index, VECTOR_INDEX_METHOD
+)
+
+
+def print_progress(done, total):
+    sys.stdout.write(f"\r  backfilled ids up to {done}/{total}")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Add half-precision (halfvec) embeddings to legal_chunks and index them.")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows updated per commit")
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default=VECTOR_INDEX_METHOD)
+    parser.add_argument("--drop-full-index", action="store_true",
+                        help="drop the float32 ANN index afterwards (only once EMBEDDING_STORAGE=half is live)")
+    args = parser.parse_args()
+
+    create_tables()
+    print("Backfilling embedding_half (requires pgvector >= 0.7)...")
+    updated = migrate_to_half_storage(batch_size=args.batch_size, progress=print_progress)
+    print(f"\n{updated} rows backfilled")
+
+    print("Building halfvec index...")
+    print(rebuild_vector_index(method=args.method, storage="half"))
+    if args.drop_full_index:
+        print("Dropping float32 vector index...")
+        drop_full_vector_index()
+    print("Migration complete! Set EMBEDDING_STORAGE=half to search the halfvec index.")
@@ -1,5 +1,6 @@
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean
 from sqlalchemy.orm import relationship
+from pgvector.sqlalchemy import Vector
 from datetime import datetime
 from config.database import Base
 
@@ -28,6 +29,7 @@ class Query(Base):
     documents_used = Column(Text)  # JSON string of document references
     created_at = Column(DateTime, default=datetime.utcnow)
     response_time = Column(Float)  # in seconds
+    trace = Column(Text)  # JSON of per-stage timings (ms) and token counts
 
     # Relationships
     user = relationship("User", back_populates="queries")
@@ -48,3 +50,13 @@ class Feedback(Base):
     # Relationships
     user = relationship("User", back_populates="feedback")
     query = relationship("Query", back_populates="feedback")
+
+
+class QueryEmbedding(Base):
+    """Question embedding for a logged query, used by the semantic answer cache."""
+    __tablename__ = "query_embeddings"
+
+    query_id = Column(Integer, ForeignKey("queries.id"), primary_key=True)
+    embedding = Column(Vector(384))
+    corpus_version = Column(String(32))  # vector_db.corpus_version() when answered
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,18 +1,20 @@
 import streamlit as st
-import requests
-from dotenv import load_dotenv
-import os
 import time
+from contextlib import ExitStack
 from datetime import datetime
-from utils.db_utils import log_query, log_feedback
+from utils.db_utils import queue_query, queue_feedback, get_queries_by_ids
 from utils.auth import get_current_firebase_user, login_required
 from config.database import SessionLocal
+from sqlalchemy.exc import SQLAlchemyError
 import json
 import re
-from utils.vector_db import search_chunks  # <-- NEW IMPORT
-
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+from utils.vector_db import search_chunks, warm_up_in_background
+from utils.llm_client import stream_chat_completion, LLMError
+from utils import answer_cache
+from utils.context_packer import pack_context, CONTEXT_TOKEN_BUDGET
+from utils.conversation_memory import ConversationMemory
+from utils.tokens import count_tokens
+from utils.tracing import span, add_count, start_trace, finish_trace, start_metrics_server
 
 
 def extract_document_references(text):
@@ -50,120 +52,203 @@ def format_response(text):
     return '\n\n'.join(formatted_sections)
 
 
-def get_context_from_db(user_query, k=5):
-    results = search_chunks(user_query, k=k)
-    context = "\n\n".join([r[1] for r in results])  # r[1] is the chunk text
-    return context
+def retrieve_context(user_query, k=5, budget=CONTEXT_TOKEN_BUDGET, mode=None,
+                     vector_weight=None, lexical_weight=None):
+    """Retrieve the top `k` chunks and pack them into `budget` tokens.
 
+    Returns a PackedContext, which also reports the tokens trimmed as
+    overlapping or duplicate spans and those dropped for lack of budget.
+    `mode` ("vector" or "hybrid") and the fusion weights default to the
+    RETRIEVAL_MODE / HYBRID_*_WEIGHT settings."""
+    results = search_chunks(user_query, k=k, mode=mode,
+                            vector_weight=vector_weight, lexical_weight=lexical_weight)
+    with span("pack_context"):
+        packed = pack_context([r[1] for r in results], budget=budget)  # r[1] is the chunk text
+    add_count("context_tokens", packed.tokens)
+    add_count("context_duplicate_tokens", packed.duplicate_tokens)
+    add_count("context_dropped_tokens", packed.dropped_tokens)
+    return packed
 
-@login_required
-def chat_interface():
-    st.header("💬 Nigerian Legal AI Assistant")
 
-    # Initialize chat history
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = [
-            {
-                "role": "system",
-                "content": """You are a legal assistant specialized in Nigerian laws. 
-                Follow these guidelines:
-                1. Always cite relevant laws and sections
-                2. Provide context and explanations
-                3. Mention if laws have been updated or amended
-                4. Include relevant case law when applicable
-                5. Be clear about jurisdiction (Federal, State, or both)
-                6. If unsure, acknowledge limitations
-                7. Format responses with clear sections and bullet points using Markdown only. DO NOT use any HTML tags (e.g., <div>, <span>).
-                8. Always start with a brief summary
-                9. End with practical implications or next steps"""
-            }
-        ]
+def get_context_from_db(user_query, k=5, mode=None, vector_weight=None, lexical_weight=None):
+    """Retrieve context for a question as one string (see retrieve_context)."""
+    return retrieve_context(user_query, k=k, mode=mode, vector_weight=vector_weight,
+                            lexical_weight=lexical_weight).text
 
-    # Text input
-    user_input = st.text_input(
-        "Ask a legal question (e.g., What are the rights of tenants under the Land Use Act?)")
-
-    if st.button("Ask") and user_input:
-        start_time = time.time()
 
-        # Add user message to chat history
-        st.session_state.chat_history.append(
-            {"role": "user", "content": user_input})
-
-        with st.spinner("Thinking like a lawyer..."):
-            try:
-                # --- RAG: Retrieve context from vector DB ---
-                context = get_context_from_db(user_input, k=5)
-
-                # --- Compose prompt with context ---
-                prompt = f"""
+def chat_prompt(context, question):
+    """The user turn sent to the LLM: the question with its retrieved context."""
+    return f"""
                 You are a Nigerian legal expert AI. Use the following context from Nigerian law to answer the user's question. Cite the source if possible.
 
                 Context:
                 {context}
 
                 Question:
-                {user_input}
+                {question}
                 """
 
-                # --- Call Groq API with RAG prompt ---
-                url = "https://api.groq.com/openai/v1/chat/completions"
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {GROQ_API_KEY}"
-                }
-                payload = {
-                    "model": "llama3-8b-8192",
-                    "messages": [
-                        {"role": "system", "content": prompt}
-                    ],
-                    "temperature": 0.2,
-                    "max_tokens": 1000,
-                    "stream": False
-                }
-
-                response = requests.post(url, headers=headers, json=payload)
-                if response.status_code != 200:
-                    st.error(
-                        f"API error: {response.status_code} - {response.text}")
-                    return
-
-                data = response.json()
-                answer = data['choices'][0]['message']['content']
 
-                # Extract document references
-                references = extract_document_references(answer)
+SYSTEM_PROMPT = """You are a legal assistant specialized in Nigerian laws. 
+Follow these guidelines:
+1. Always cite relevant laws and sections
+2. Provide context and explanations
+3. Mention if laws have been updated or amended
+4. Include relevant case law when applicable
+5. Be clear about jurisdiction (Federal, State, or both)
+6. If unsure, acknowledge limitations
+7. Format responses with clear sections and bullet points using Markdown only. DO NOT use any HTML tags (e.g., <div>, <span>).
+8. Always start with a brief summary
+9. End with practical implications or next steps"""
+
+
+def answer_question(memory, question, user_id, show_stream):
+    """Everything an Ask click does except rendering: answer `question` in
+    the conversation held by `memory`, add the exchange to it, log the
+    query and remember it in the answer cache.
+
+    `show_stream(pieces)` consumes the streamed LLM answer and returns its
+    full text. It is not called when the answer cache serves the question.
+    Returns (answer, query_id, from_cache); query_id is None when the query
+    could not be logged. Raises LLMError if the LLM call fails.
+    """
+    start_time = time.time()
+    start_trace()
+
+    # Serve a near-duplicate of a recent, well-rated question instantly;
+    # follow-ups depend on the conversation so always go to the LLM
+    is_first = len(memory) == 0
+    cached_answer = None
+    if is_first:
+        try:
+            with span("cache_lookup"), SessionLocal() as db:
+                cached = answer_cache.lookup(db, question)
+                cached_answer = cached.response if cached is not None else None
+        except SQLAlchemyError as e:
+            # The cache is an optimisation; answer without it while the DB is away
+            print(f"Answer cache lookup failed: {e}")
+
+    if cached_answer is not None:
+        answer = cached_answer
+    else:
+        with span("retrieve"):
+            # --- RAG: Retrieve context from vector DB ---
+            context = retrieve_context(question, k=5).text
+
+        # --- Compose prompt with context and stream the answer ---
+        messages = memory.messages(chat_prompt(context, question))
+        add_count("prompt_tokens", sum(count_tokens(m["content"]) for m in messages))
+        with span("llm"):
+            answer = show_stream(stream_chat_completion(
+                messages,
+                temperature=0.2,
+                max_tokens=1000,
+            ))
+        add_count("completion_tokens", count_tokens(answer))
+
+    with span("format"):
+        references = extract_document_references(answer)
+        formatted_answer = format_response(answer)
+    response_time = time.time() - start_time
+
+    # Keep the answer even if logging it fails below
+    memory.add_exchange(question, formatted_answer)
+
+    # Log the query and response (written in the background)
+    trace = finish_trace()
+    try:
+        with span("log"):  # process-wide metrics only; the trace is already closed
+            query_id = queue_query(
+                user_id=user_id,
+                question=question,
+                response=answer,
+                documents_used=references,
+                response_time=response_time,
+                trace=trace
+            )
+    except Exception as e:
+        print(f"Logging the query failed: {e}")
+        return answer, None, cached_answer is not None
+    memory.attach_query_id(query_id)
+
+    # Only opening questions are cached: a follow-up's answer leans on the
+    # earlier conversation and would be wrong for someone else's first question
+    if cached_answer is None and is_first:
+        try:
+            answer_cache.remember(query_id, question)
+        except SQLAlchemyError as e:
+            print(f"Answer cache update failed: {e}")
+    return answer, query_id, cached_answer is not None
 
-                # Format the response
-                formatted_answer = format_response(answer)
 
-                st.session_state.chat_history.append(
-                    {"role": "assistant", "content": formatted_answer})
+@login_required
+def chat_interface():
+    st.header("💬 Nigerian Legal AI Assistant")
 
-                # Calculate response time
-                response_time = time.time() - start_time
+    # Load the embedding model while the user types their question
+    warm_up_in_background()
+    start_metrics_server()
 
-                # Log the query and response
-                with SessionLocal() as db:
-                    user = get_current_firebase_user()
-                    query = log_query(
-                        db=db,
-                        user_id=user['id'],
-                        question=user_input,
-                        response=answer,
-                        documents_used=references,
-                        response_time=response_time
-                    )
+    # Conversation memory: recent exchanges plus a summary of older ones
+    if "chat_memory" not in st.session_state:
+        st.session_state.chat_memory = ConversationMemory(SYSTEM_PROMPT)
+    memory = st.session_state.chat_memory
 
-                    # Store query ID for feedback
-                    st.session_state.last_query_id = query.id
+    # Text input
+    user_input = st.text_input(
+        "Ask a legal question (e.g., What are the rights of tenants under the Land Use Act?)")
 
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                return
+    if st.button("Ask") and user_input:
+        try:
+            user = get_current_firebase_user()
+            # The streamed copy is cleared once complete; the conversation
+            # below then renders the formatted answer with its references.
+            stream_box = st.empty()
+
+            with ExitStack() as thinking:
+                thinking.enter_context(st.spinner("Thinking like a lawyer..."))
+
+                def show_stream(pieces):
+                    thinking.close()
+                    with stream_box.container():
+                        st.markdown("**JuristAI:**")
+                        return st.write_stream(pieces)
+
+                try:
+                    _, query_id, from_cache = answer_question(memory, user_input, user['id'], show_stream)
+                except LLMError as e:
+                    st.error(f"API error: {e}")
+                    return
+                finally:
+                    stream_box.empty()
+
+            if from_cache:
+                st.toast("⚡ Answered from a similar, well-rated question")
+
+            # Store query ID for feedback
+            st.session_state.last_query_id = query_id
+            if query_id is None:
+                st.warning("This answer could not be saved, so feedback is unavailable for it.")
+
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+            return
+
+    # Older exchanges live in the queries table, not in session state
+    if memory.offloaded_ids and st.checkbox(
+            f"Show {len(memory.offloaded_ids)} earlier exchanges", key="show_earlier"):
+        with SessionLocal() as db:
+            for earlier in get_queries_by_ids(db, memory.offloaded_ids):
+                st.markdown(f"**You:** {earlier.question}")
+                st.markdown(f"**JuristAI:** {format_response(earlier.response)}")
+        st.markdown("---")
 
     # Display conversation
-    for idx, msg in enumerate(st.session_state.chat_history[1:]):
+    chat_history = []
+    for question, answer, _ in memory.exchanges:
+        chat_history += [{"role": "user", "content": question},
+                         {"role": "assistant", "content": answer}]
+    for idx, msg in enumerate(chat_history):
         role = "You" if msg["role"] == "user" else "JuristAI"
 
         # Create a container for each message
@@ -202,7 +287,8 @@ def chat_interface():
                 st.markdown(msg['content'])
 
         # Show feedback only for the latest assistant message
-        if msg["role"] == "assistant" and idx == len(st.session_state.chat_history[1:]) - 1:
+        if (msg["role"] == "assistant" and idx == len(chat_history) - 1
+                and st.session_state.get("last_query_id") is not None):
             st.markdown("---")
             st.markdown("**Was this answer helpful?**")
 
@@ -210,26 +296,22 @@ def chat_interface():
 
             with col1:
                 if st.button("👍 Yes", key="helpful_yes"):
-                    with SessionLocal() as db:
-                        log_feedback(
-                            db=db,
-                            user_id=get_current_firebase_user()['id'],
-                            query_id=st.session_state.last_query_id,
-                            rating=5,
-                            is_helpful=True
-                        )
+                    queue_feedback(
+                        user_id=get_current_firebase_user()['id'],
+                        query_id=st.session_state.last_query_id,
+                        rating=5,
+                        is_helpful=True
+                    )
                     st.success("Feedback submitted! Thank you!")
 
             with col2:
                 if st.button("👎 No", key="helpful_no"):
-                    with SessionLocal() as db:
-                        log_feedback(
-                            db=db,
-                            user_id=get_current_firebase_user()['id'],
-                            query_id=st.session_state.last_query_id,
-                            rating=1,
-                            is_helpful=False
-                        )
+                    queue_feedback(
+                        user_id=get_current_firebase_user()['id'],
+                        query_id=st.session_state.last_query_id,
+                        rating=1,
+                        is_helpful=False
+                    )
                     st.info("Feedback submitted. We will use this to improve.")
 
             with col3:
@@ -237,37 +319,20 @@ def chat_interface():
                     "Optional: Please tell us more about your feedback", key="feedback_text")
                 if st.button("Submit Additional Feedback", key="submit_additional_feedback"):
                     if feedback_text:
-                        with SessionLocal() as db:
-                            log_feedback(
-                                db=db,
-                                user_id=get_current_firebase_user()['id'],
-                                query_id=st.session_state.last_query_id,
-                                rating=0,
-                                is_helpful=False,
-                                feedback_text=feedback_text
-                            )
-                            st.success(
-                                "Additional feedback submitted! Thank you!")
+                        queue_feedback(
+                            user_id=get_current_firebase_user()['id'],
+                            query_id=st.session_state.last_query_id,
+                            rating=0,
+                            is_helpful=False,
+                            feedback_text=feedback_text
+                        )
+                        st.success(
+                            "Additional feedback submitted! Thank you!")
                     else:
                         st.warning(
                             "Please enter some text for additional feedback.")
 
     # Add a clear chat button in the sidebar
     if st.sidebar.button("Clear Chat History"):
-        st.session_state.chat_history = [
-            {
-                "role": "system",
-                "content": """You are a legal assistant specialized in Nigerian laws. 
-                Follow these guidelines:
-                1. Always cite relevant laws and sections
-                2. Provide context and explanations
-                3. Mention if laws have been updated or amended
-                4. Include relevant case law when applicable
-                5. Be clear about jurisdiction (Federal, State, or both)
-                6. If unsure, acknowledge limitations
-                7. Format responses with clear sections and bullet points using Markdown only. DO NOT use any HTML tags (e.g., <div>, <span>).
-                8. Always start with a brief summary
-                9. End with practical implications or next steps"""
-            }
-        ]
+        st.session_state.chat_memory = ConversationMemory(SYSTEM_PROMPT)
         st.experimental_rerun()
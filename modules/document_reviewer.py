@@ -1,21 +1,25 @@
 # FILE: modules/document_reviewer.py
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
 import fitz  # PyMuPDF
-import os
-import requests
-from dotenv import load_dotenv
 from utils.auth import login_required
+from utils.llm_client import chat_completion, stream_chat_completion, LLMError, PRIORITY_BULK
+from utils.tokens import count_tokens, split_by_tokens
 
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# llama3-8b-8192 has an 8k context: a section plus its prompt and the
+# section notes must fit, with room left for the answer.
+REVIEW_SECTION_TOKENS = int(os.getenv("REVIEW_SECTION_TOKENS", "3000"))
+REVIEW_NOTES_TOKENS = int(os.getenv("REVIEW_NOTES_TOKENS", "600"))
+# Sections analysed at once per review
+REVIEW_CONCURRENCY = int(os.getenv("REVIEW_CONCURRENCY", "4"))
 
 def extract_text_from_pdf(uploaded_file):
     with fitz.open(stream=uploaded_file.read(), filetype="pdf") as doc:
         text = "\n".join(page.get_text() for page in doc)
     return text
 
-def summarize_and_flag(text):
+def review_messages(text):
     prompt = f"""
 You are a Nigerian legal expert AI. Analyze the following legal document and:
 1. Summarize its purpose.
@@ -25,45 +29,109 @@ You are a Nigerian legal expert AI. Analyze the following legal document and:
 Document:
 {text}
 """
+    return [{"role": "user", "content": prompt}]
 
-    # Try Groq API first
-    if GROQ_API_KEY:
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {GROQ_API_KEY}"
-        }
-        payload = {
-            "model": "llama3-8b-8192",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "max_tokens": 1500,
-            "stream": False
+def summarize_and_flag(text):
+    try:
+        if count_tokens(text) > REVIEW_SECTION_TOKENS:
+            return "".join(stream_map_reduce_review(text))
+        return chat_completion(
+            review_messages(text),
+            temperature=0.3,
+            max_tokens=1500,
+            fallback_model="gpt-4",
+            priority=PRIORITY_BULK,
+        )
+    except LLMError as e:
+        st.error(str(e))
+        return None
+
+def stream_review(text):
+    """summarize_and_flag as a stream of answer pieces; raises LLMError."""
+    return stream_chat_completion(
+        review_messages(text),
+        temperature=0.3,
+        max_tokens=1500,
+        fallback_model="gpt-4",
+        priority=PRIORITY_BULK,
+    )
+
+def section_messages(section, index, total):
+    prompt = f"""
+You are a Nigerian legal expert AI reviewing part {index} of {total} of a longer legal document.
+For this part only, write concise notes covering:
+1. What it provides (parties, obligations, key terms).
+2. Any risks or legal red flags, citing the clause.
+3. Any clauses that look missing or weak so far.
+
+Document part {index} of {total}:
+{section}
+"""
+    return [{"role": "user", "content": prompt}]
+
+def merge_messages(notes):
+    joined = "\n\n".join(notes)
+    prompt = f"""
+You are a Nigerian legal expert AI. The notes below were written section by section over one legal document, in order. Using them:
+1. Summarize the document's purpose.
+2. Highlight every risk or legal red flag, citing the clause.
+3. Suggest any missing or weak clauses, considering the document as a whole.
+
+Section notes:
+{joined}
+"""
+    return [{"role": "user", "content": prompt}]
+
+def analyse_sections(sections, make_messages, max_workers=REVIEW_CONCURRENCY, on_done=None):
+    """Run one LLM call per section concurrently; returns results in order.
+
+    Runs in worker threads, so it must not touch Streamlit; `on_done(done,
+    total)` is called from the calling thread for progress. Raises LLMError
+    if any section fails, since a dropped section would hide its red flags.
+    """
+    results = [None] * len(sections)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {
+            pool.submit(chat_completion, make_messages(section, i + 1, len(sections)),
+                        temperature=0.3, max_tokens=REVIEW_NOTES_TOKENS,
+                        fallback_model="gpt-3.5-turbo", priority=PRIORITY_BULK): i
+            for i, section in enumerate(sections)
         }
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"]
-        else:
-            st.error(f"Groq API error: {response.status_code} {response.text}")
-
-    # Fallback to OpenAI GPT-4
-    if OPENAI_API_KEY:
-        import openai
-        openai.api_key = OPENAI_API_KEY
-        try:
-            resp = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=1500,
-            )
-            return resp.choices[0].message.content
-        except Exception as e:
-            st.error(f"OpenAI API error: {e}")
-            return None
-
-    st.error("No valid API key found. Please set GROQ_API_KEY or OPENAI_API_KEY in your environment.")
-    return None
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                results[i] = f"Section {i + 1}:\n{future.result()}"
+            except LLMError as e:
+                for pending in futures:
+                    pending.cancel()
+                raise LLMError(f"Section {i + 1} of {len(sections)} failed: {e}")
+            if on_done:
+                on_done(done, len(sections))
+    return results
+
+def _combine_notes(notes, on_done=None):
+    """Condense section notes until they fit one merge prompt."""
+    while count_tokens("\n\n".join(notes)) > REVIEW_SECTION_TOKENS and len(notes) > 1:
+        groups = split_by_tokens("\n\n".join(notes), REVIEW_SECTION_TOKENS)
+        if len(groups) >= len(notes):  # every note is already a group on its own
+            break
+        notes = analyse_sections(groups, lambda group, i, n: [{"role": "user", "content": (
+            "Condense these consecutive section notes from one legal document, keeping "
+            f"every red flag and clause reference:\n\n{group}")}], on_done=on_done)
+    return notes
+
+def stream_map_reduce_review(text, on_done=None):
+    """Review a long document: analyse token-bounded sections concurrently,
+    then stream a merged summary and red-flag list. Raises LLMError."""
+    sections = split_by_tokens(text, REVIEW_SECTION_TOKENS)
+    notes = _combine_notes(analyse_sections(sections, section_messages, on_done=on_done), on_done)
+    return stream_chat_completion(
+        merge_messages(notes),
+        temperature=0.3,
+        max_tokens=1500,
+        fallback_model="gpt-4",
+        priority=PRIORITY_BULK,
+    )
 
 @login_required
 def document_review_ui():
@@ -71,16 +139,30 @@ def document_review_ui():
     uploaded_file = st.file_uploader("Upload PDF file", type=["pdf"])
 
     if uploaded_file is not None:
-        with st.spinner("Reading and analyzing document..."):
+        with st.spinner("Reading document..."):
             text = extract_text_from_pdf(uploaded_file)
             st.subheader("📝 Extracted Text (Preview)")
             st.text_area("", text[:3000], height=300)
 
-            analysis = summarize_and_flag(text)
+        st.subheader("🧠 AI Analysis Summary")
+        try:
+            if count_tokens(text) <= REVIEW_SECTION_TOKENS:
+                analysis = st.write_stream(stream_review(text))
+            else:
+                # Too long for one prompt: review sections in parallel, then merge
+                progress = st.progress(0.0, text="Reviewing sections...")
+
+                def on_done(done, total):
+                    progress.progress(done / total, text=f"Reviewed {done} of {total} sections")
+
+                stream = stream_map_reduce_review(text, on_done=on_done)
+                progress.empty()
+                analysis = st.write_stream(stream)
+        except LLMError as e:
+            st.error(str(e))
+            analysis = None
 
         if analysis:
-            st.subheader("🧠 AI Analysis Summary")
-            st.write(analysis)
             st.success("✅ Review Complete")
 
 
@@ -1,13 +1,8 @@
 # FILE: modules/legal_template.py
 import streamlit as st
-import os
-import requests
-from dotenv import load_dotenv
 from utils.auth import login_required
-
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+from utils.llm_client import LLMError, PRIORITY_BULK
+from utils.response_cache import cached_stream_chat_completion
 
 @login_required
 def template_builder_ui():
@@ -32,50 +27,26 @@ You are a Nigerian legal AI assistant. Draft a {template_type} based on the foll
 The output should be formatted as a complete legal document under Nigerian law.
 """
 
-        with st.spinner("Generating document..."):
-            # Try Groq API first
-            if GROQ_API_KEY:
-                url = "https://api.groq.com/openai/v1/chat/completions"
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {GROQ_API_KEY}"
-                }
-                payload = {
-                    "model": "llama3-8b-8192",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.3,
-                    "max_tokens": 1000,
-                    "stream": False
-                }
-                response = requests.post(url, headers=headers, json=payload)
-                if response.status_code == 200:
-                    document = response.json()["choices"][0]["message"]["content"]
-                else:
-                    st.error(f"Groq API error: {response.status_code} {response.text}")
-                    document = None
-
-            # Fallback to OpenAI if Groq not available or error
-            elif OPENAI_API_KEY:
-                import openai
-                openai.api_key = OPENAI_API_KEY
-                try:
-                    resp = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo",
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=0.3,
-                        max_tokens=1000,
-                    )
-                    document = resp.choices[0].message.content
-                except Exception as e:
-                    st.error(f"OpenAI API error: {e}")
-                    document = None
-            else:
-                st.error("No valid API key found. Please set GROQ_API_KEY or OPENAI_API_KEY in your environment.")
-                document = None
+        st.subheader("📄 Generated Document")
+        placeholder = st.empty()
+        parts = []
+        try:
+            for piece in cached_stream_chat_completion(
+                "template_builder",
+                [{"role": "user", "content": prompt}],
+                temperature=0.3,
+                max_tokens=1000,
+                fallback_model="gpt-3.5-turbo",
+                priority=PRIORITY_BULK,
+            ):
+                parts.append(piece)
+                placeholder.code("".join(parts), language="markdown")
+            document = "".join(parts)
+        except LLMError as e:
+            st.error(str(e))
+            document = None
 
         if document:
-            st.subheader("📄 Generated Document")
-            st.code(document, language="markdown")
             st.success("✅ Template generated")
 
 
@@ -5,11 +5,12 @@ import os
 import json
 from dotenv import load_dotenv
 import httpx  # you need to pip install httpx
+from utils.llm_client import GROQ_BASE_URL
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/audio/transcriptions"  # Hypothetical Groq endpoint
+GROQ_API_URL = f"{GROQ_BASE_URL}/audio/transcriptions"
 
 def voice_to_text_ui():
     st.header("🎤 Voice to Text - Legal AI Assistant (via Groq LLaMA 3)")
@@ -0,0 +1,14 @@
+import argparse
+from utils.response_cache import purge, RESPONSE_CACHE_PATH
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Clear cached LLM responses for Law Search, Query Builder and Template Builder.")
+    parser.add_argument("--tool", choices=["law_search", "query_builder", "template_builder"],
+                        help="only purge this tool's entries")
+    parser.add_argument("--expired", action="store_true",
+                        help="only purge entries older than RESPONSE_CACHE_TTL_HOURS")
+    args = parser.parse_args()
+
+    deleted = purge(tool=args.tool, expired_only=args.expired)
+    print(f"Removed {deleted} cached responses from {RESPONSE_CACHE_PATH}")
@@ -0,0 +1,24 @@
+import argparse
+from utils.vector_db import (
+    create_tables, rebuild_vector_index, VECTOR_INDEX_METHOD, HNSW_M,
+    HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS, VECTOR_INDEX_BUILD_MEM
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the approximate nearest-neighbour index on legal_chunks.")
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default=VECTOR_INDEX_METHOD)
+    parser.add_argument("--m", type=int, default=HNSW_M, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--lists", type=int, default=IVFFLAT_LISTS,
+                        help="IVFFlat lists (0 derives it from the row count)")
+    parser.add_argument("--maintenance-work-mem", default=VECTOR_INDEX_BUILD_MEM)
+    args = parser.parse_args()
+
+    create_tables()
+    print("Building vector index...")
+    statement = rebuild_vector_index(
+        method=args.method, m=args.m, ef_construction=args.ef_construction,
+        lists=args.lists, maintenance_work_mem=args.maintenance_work_mem)
+    print(statement)
+    print("Vector index rebuilt successfully!")
@@ -0,0 +1,51 @@
+"""Run with: python -m unittest discover tests"""
+import unittest
+from unittest import mock
+import numpy as np
+from utils import vector_db
+
+
+class StubEncoder:
+    """Stands in for the sentence-transformer: one distinct vector per text."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=None):
+        self.calls.append(list(texts))
+        return np.array([[float(len(text)), float(sum(map(ord, text)))] for text in texts],
+                        dtype="float32")
+
+
+class EncodeManyTest(unittest.TestCase):
+    def setUp(self):
+        vector_db.clear_query_cache()
+        self.encoder = StubEncoder()
+        patcher = mock.patch.object(vector_db, "get_model", return_value=self.encoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(vector_db.clear_query_cache)
+
+    def test_misses_are_encoded_in_one_batch(self):
+        vectors = vector_db.encode_many(["Right to life", "Caveat"])
+        self.assertEqual(self.encoder.calls, [["right to life", "caveat"]])
+        np.testing.assert_array_equal(vectors[0], self.encoder.encode(["right to life"])[0])
+        np.testing.assert_array_equal(vectors[1], self.encoder.encode(["caveat"])[0])
+
+    def test_hits_come_from_the_cache(self):
+        first = vector_db.encode_many(["Right to life"])[0]
+        again = vector_db.encode_many(["  right TO life "])[0]
+        self.assertEqual(len(self.encoder.calls), 1)
+        np.testing.assert_array_equal(first, again)
+
+    def test_mixed_hits_and_misses_keep_query_order(self):
+        cached = vector_db.embed_query("Caveat")
+        vectors = vector_db.encode_many(["Right to life", "caveat", "Right to life", "Bail"])
+        self.assertEqual(self.encoder.calls[-1], ["right to life", "bail"])
+        np.testing.assert_array_equal(vectors[1], cached)
+        np.testing.assert_array_equal(vectors[0], vectors[2])
+        self.assertFalse(np.array_equal(vectors[0], vectors[3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
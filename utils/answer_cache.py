@@ -0,0 +1,81 @@
+"""Semantic cache of chat answers, backed by the queries and feedback tables.
+
+Every answered question's embedding is stored in query_embeddings. A new
+question is served from cache when a recent, well-rated answer (helpful
+feedback and no thumbs-down) exists for a question whose embedding is
+within ANSWER_CACHE_THRESHOLD cosine similarity, and it was answered
+against the current corpus version.
+"""
+import os
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from pgvector.sqlalchemy import Vector
+from models.database_models import Query, QueryEmbedding
+from utils.vector_db import embed_query, corpus_version
+from utils.log_writer import get_log_writer
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+# Minimum cosine similarity between questions for a cache hit
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "168"))
+# Feedback rating (1-5) that counts as well rated, besides is_helpful
+ANSWER_CACHE_MIN_RATING = int(os.getenv("ANSWER_CACHE_MIN_RATING", "4"))
+
+_LOOKUP_SQL = sa.text("""
+SELECT e.query_id, e.embedding <=> :embedding AS distance
+FROM query_embeddings e
+WHERE e.corpus_version = :version
+  AND e.created_at >= :since
+  AND EXISTS (SELECT 1 FROM feedback f
+              WHERE f.query_id = e.query_id
+                AND (f.is_helpful OR f.rating >= :min_rating))
+  AND NOT EXISTS (SELECT 1 FROM feedback f
+                  WHERE f.query_id = e.query_id AND f.rating BETWEEN 1 AND 2)
+ORDER BY distance
+LIMIT 1
+""").bindparams(sa.bindparam("embedding", type_=Vector(384)))
+
+
+def lookup(db: Session, question: str, threshold: float = None, ttl_hours: float = None):
+    """Return the cached Query answering a near-duplicate of `question`, or None."""
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+    ttl_hours = ANSWER_CACHE_TTL_HOURS if ttl_hours is None else ttl_hours
+    row = db.execute(_LOOKUP_SQL, {
+        "embedding": embed_query(question),
+        "version": corpus_version(),
+        "since": datetime.utcnow() - timedelta(hours=ttl_hours),
+        "min_rating": ANSWER_CACHE_MIN_RATING,
+    }).first()
+    if row is None or 1 - row.distance < threshold:
+        return None
+    return db.get(Query, row.query_id)
+
+
+def remember(query_id: int, question: str):
+    """Store the embedding of an answered question so later lookups can find
+    it. Written through the log writer, after the query row itself."""
+    if not ANSWER_CACHE_ENABLED:
+        return
+    get_log_writer().enqueue(QueryEmbedding(
+        query_id=query_id,
+        embedding=embed_query(question),
+        corpus_version=corpus_version(),
+        created_at=datetime.utcnow(),
+    ))
+
+
+def purge(db: Session, everything: bool = False):
+    """Delete expired entries and entries from older corpus versions
+    (or all entries). Returns the number of rows deleted."""
+    statement = sa.delete(QueryEmbedding)
+    if not everything:
+        statement = statement.where(sa.or_(
+            QueryEmbedding.corpus_version != corpus_version(max_age=0),
+            QueryEmbedding.created_at < datetime.utcnow() - timedelta(hours=ANSWER_CACHE_TTL_HOURS),
+        ))
+    deleted = db.execute(statement).rowcount
+    db.commit()
+    return deleted
@@ -0,0 +1,95 @@
+"""Fit retrieved chunks into a token budget for the RAG prompt.
+
+Ingestion overlaps neighbouring chunks by 50 words, so the top results
+often repeat the same passage. pack_context() walks the chunks in
+relevance order, trims spans already present in the packed context,
+drops chunks that are mostly repeats, and stops adding text once the
+token budget is full. It reports what was left out.
+"""
+import os
+from collections import namedtuple
+from utils.tokens import count_tokens
+
+# Token budget for retrieved context in a chat prompt; llama3-8b-8192 also
+# needs room for the instructions, the question and a 1000-token answer.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))
+# Words per shingle when matching repeated spans
+SHINGLE_WORDS = 8
+# A chunk whose words are this fraction already-packed is dropped outright
+DUPLICATE_FRACTION = 0.8
+# Smallest tail worth truncating a chunk to when it doesn't fit whole
+MIN_PIECE_TOKENS = 64
+
+PackedContext = namedtuple(
+    "PackedContext",
+    ["text", "tokens", "budget", "duplicate_tokens", "dropped_tokens", "chunks_used", "chunks_total"],
+)
+
+
+def _shingles(words):
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _covered(words, seen):
+    """Per-word flags: True where the word lies in a shingle already packed."""
+    covered = [False] * len(words)
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        if tuple(words[i:i + SHINGLE_WORDS]) in seen:
+            covered[i:i + SHINGLE_WORDS] = [True] * SHINGLE_WORDS
+    return covered
+
+
+def _truncate(words, max_tokens):
+    """Longest word prefix whose text fits `max_tokens`."""
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return words[:lo]
+
+
+def pack_context(texts, budget=CONTEXT_TOKEN_BUDGET, separator="\n\n"):
+    """Pack chunk `texts` (most relevant first) into at most `budget` tokens.
+
+    Returns a PackedContext: the joined text, its token count, and the
+    tokens removed as duplicates or left out for lack of budget.
+    """
+    pieces, seen = [], set()
+    used = duplicate = dropped = 0
+    separator_tokens = count_tokens(separator)
+    for text in texts:
+        words = text.split()
+        original = count_tokens(text)
+        covered = _covered(words, seen)
+        if words and sum(covered) / len(words) >= DUPLICATE_FRACTION:
+            duplicate += original
+            continue
+        # Overlap between neighbouring chunks sits at their edges: trim it
+        start, stop = 0, len(words)
+        while start < stop and covered[start]:
+            start += 1
+        while stop > start and covered[stop - 1]:
+            stop -= 1
+        kept = words[start:stop]
+        duplicate += original - count_tokens(" ".join(kept))
+
+        available = budget - used - (separator_tokens if pieces else 0)
+        tokens = count_tokens(" ".join(kept))
+        if tokens > available:
+            if available < MIN_PIECE_TOKENS:
+                dropped += tokens
+                continue
+            truncated = _truncate(kept, available)
+            dropped += tokens - count_tokens(" ".join(truncated))
+            kept, tokens = truncated, count_tokens(" ".join(truncated))
+        if not kept:
+            continue
+        pieces.append(" ".join(kept))
+        seen |= _shingles(kept)
+        used += tokens + (separator_tokens if len(pieces) > 1 else 0)
+
+    return PackedContext(separator.join(pieces), used, budget, duplicate, dropped,
+                         len(pieces), len(texts))
@@ -0,0 +1,126 @@
+"""Token-bounded conversation memory for the chat assistant.
+
+The LLM sees the system prompt, a running summary of older exchanges and
+the most recent exchanges verbatim, within CHAT_MEMORY_TOKENS. When the
+verbatim window overflows, the oldest exchanges are folded into the
+summary by a background LLM call and dropped from session state. Only
+their query ids are kept, because the full text is already in the
+queries table. Session memory per user therefore stays bounded however
+long the conversation runs.
+
+Nothing here touches Streamlit; the object lives in st.session_state.
+"""
+import os
+import threading
+from utils.tokens import count_tokens
+from utils.llm_client import chat_completion, LLMError, PRIORITY_BULK
+
+# Tokens of verbatim recent exchanges sent with each question
+CHAT_MEMORY_TOKENS = int(os.getenv("CHAT_MEMORY_TOKENS", "1500"))
+# Hard cap on verbatim exchanges kept in session, whatever their size
+CHAT_MEMORY_MAX_EXCHANGES = int(os.getenv("CHAT_MEMORY_MAX_EXCHANGES", "6"))
+# Length limit for the running summary of older exchanges
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+
+
+class ConversationMemory:
+    def __init__(self, system_prompt):
+        self.system_prompt = system_prompt
+        self.exchanges = []        # recent (question, answer, query_id), oldest first
+        self.summary = ""
+        self.offloaded_ids = []    # query ids of exchanges folded into the summary
+        self._pending = []         # evicted exchanges not yet in the summary
+        self._lock = threading.Lock()
+        self._summarizer = None
+        self._last = None
+
+    def __len__(self):
+        return len(self.offloaded_ids) + len(self.exchanges)
+
+    def add_exchange(self, question, answer, query_id=None):
+        """Record an answered question and compact the window if needed."""
+        with self._lock:
+            self._last = (question, answer, query_id)
+            self.exchanges.append(self._last)
+            while len(self.exchanges) > 1 and (
+                len(self.exchanges) > CHAT_MEMORY_MAX_EXCHANGES
+                or self._window_tokens() > CHAT_MEMORY_TOKENS
+            ):
+                evicted = self.exchanges.pop(0)
+                self._pending.append(evicted)
+                if evicted[2] is not None:
+                    self.offloaded_ids.append(evicted[2])
+            # _summarizer is cleared under the lock when the thread finds
+            # nothing left to do, so no evicted exchange can be missed
+            start = bool(self._pending) and self._summarizer is None
+            if start:
+                self._summarizer = threading.Thread(target=self._summarize, daemon=True,
+                                                    name="conversation-summary")
+        if start:
+            self._summarizer.start()
+
+    def attach_query_id(self, query_id):
+        """Set the query id of the exchange added last, once it is logged."""
+        with self._lock:
+            if self._last is None:
+                return
+            question, answer, _ = self._last
+            entry = (question, answer, query_id)
+            for window in (self.exchanges, self._pending):
+                for i, existing in enumerate(window):
+                    if existing is self._last:
+                        window[i] = entry
+                        break
+            if not any(existing is entry for existing in self.exchanges):
+                self.offloaded_ids.append(query_id)  # already evicted without an id
+            self._last = entry
+
+    def verbatim_exchanges(self):
+        """Exchanges still held word for word: those awaiting the summary, then the window."""
+        with self._lock:
+            return self._pending + self.exchanges
+
+    def _window_tokens(self):
+        return sum(count_tokens(q) + count_tokens(a) for q, a, _ in self.exchanges)
+
+    def _summarize(self):
+        """Fold pending exchanges into the summary until none are left."""
+        while True:
+            with self._lock:
+                batch, summary = list(self._pending), self.summary
+                if not batch:
+                    self._summarizer = None
+                    return
+            transcript = "\n\n".join(f"User: {q}\nAssistant: {a}" for q, a, _ in batch)
+            try:
+                updated = chat_completion(
+                    [{"role": "system", "content": (
+                        "You maintain a running summary of a legal consultation. Merge the new "
+                        "exchanges into the summary. Keep the user's facts, the laws and sections "
+                        f"discussed and any conclusions; stay under {CHAT_SUMMARY_TOKENS * 3 // 4} words.")},
+                     {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew exchanges:\n{transcript}"}],
+                    temperature=0.0,
+                    max_tokens=CHAT_SUMMARY_TOKENS,
+                    priority=PRIORITY_BULK,
+                ).strip()
+            except Exception as e:  # LLMError, or anything else: the loop must reach its exit
+                if not isinstance(e, LLMError):
+                    print(f"Conversation summary failed: {e}")
+                # Keep at least the questions, so follow-ups still have a thread
+                updated = "\n".join(filter(None, [summary] + [f"- Earlier question: {q}" for q, _, _ in batch]))
+            with self._lock:
+                self.summary = updated
+                del self._pending[:len(batch)]
+
+    def messages(self, prompt):
+        """Chat messages for a new turn whose user content is `prompt`."""
+        with self._lock:
+            system = self.system_prompt
+            if self.summary:
+                system += f"\n\nSummary of the earlier conversation:\n{self.summary}"
+            earlier = self._pending + self.exchanges  # pending are not summarised yet
+            history = []
+            for question, answer, _ in earlier:
+                history += [{"role": "user", "content": question},
+                            {"role": "assistant", "content": answer}]
+        return [{"role": "system", "content": system}] + history + [{"role": "user", "content": prompt}]
@@ -1,43 +1,159 @@
 import os
-from utils.vector_db import add_chunk, create_tables
-from PyPDF2 import PdfReader
-import docx2txt
+import sys
+import time
+import hashlib
+import argparse
+from utils.vector_db import (
+    create_tables, get_document_manifest, replace_document, touch_document,
+    delete_document, rebuild_vector_index, EMBED_BATCH_SIZE, VECTOR_INDEX_METHOD,
+    RETRIEVAL_BACKEND
+)
+from utils.text_extract import (
+    iter_document_pages, iter_corpus_pages, INGEST_WORKERS, PAGES_PER_TASK
+)
 
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
 
-def extract_text_from_docx(docx_path):
-    return docx2txt.process(docx_path)
+def chunk_pages(pages, chunk_size=500, overlap=50):
+    """Chunk a stream of page texts into overlapping word windows.
+
+    Produces exactly the chunks chunk_text would for the joined text, but
+    only holds about one chunk of words in memory at a time.
+    """
+    step = chunk_size - overlap
+    buffer = []
+    for page in pages:
+        buffer.extend(page.split())
+        while len(buffer) >= chunk_size:
+            yield " ".join(buffer[:chunk_size])
+            del buffer[:step]
+    while buffer:
+        yield " ".join(buffer[:chunk_size])
+        del buffer[:step]
 
 def chunk_text(text, chunk_size=500, overlap=50):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i+chunk_size])
-        chunks.append(chunk)
-    return chunks
-
-def ingest_file(file_path, source=None):
-    if file_path.lower().endswith(".pdf"):
-        text = extract_text_from_pdf(file_path)
-    elif file_path.lower().endswith(".docx"):
-        text = extract_text_from_docx(file_path)
-    else:
+    return list(chunk_pages([text], chunk_size, overlap))
+
+def print_progress(label):
+    """Return a progress(done, total) callback that redraws one CLI line."""
+    def progress(done, total):
+        of_total = f"/{total}" if total is not None else ""
+        sys.stdout.write(f"\r  {label}: {done}{of_total} chunks written")
+        sys.stdout.flush()
+    return progress
+
+def file_fingerprint(file_path):
+    """Return (sha256 of the file bytes, mtime)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest(), os.path.getmtime(file_path)
+
+def ingest_pages(pages, source, content_hash, mtime, batch_size=EMBED_BATCH_SIZE, progress=None):
+    return replace_document(source, content_hash, mtime, chunk_pages(pages),
+                            batch_size=batch_size, progress=progress)
+
+def ingest_file(file_path, source=None, batch_size=EMBED_BATCH_SIZE, progress=None):
+    if not file_path.lower().endswith(SUPPORTED_EXTENSIONS):
         print(f"Skipping unsupported file: {file_path}")
-        return
-    chunks = chunk_text(text)
-    for chunk in chunks:
-        add_chunk(chunk, source=source or file_path)
+        return 0
+    content_hash, mtime = file_fingerprint(file_path)
+    done, _ = ingest_pages(iter_document_pages(file_path), source or file_path,
+                           content_hash, mtime, batch_size=batch_size, progress=progress)
+    return done
 
-if __name__ == "__main__":
+def plan_sync(paths, manifest, force=False):
+    """Split `paths` into files needing (re-)ingestion and unchanged ones.
+
+    A matching mtime is trusted without hashing; otherwise the content hash
+    decides, so a touched-but-identical file is not re-embedded.
+    Returns ({path: (content_hash, mtime)}, unchanged_paths).
+    """
+    changed, unchanged = {}, []
+    for path in paths:
+        doc = manifest.get(path)
+        mtime = os.path.getmtime(path)
+        if not force and doc is not None and doc.mtime == mtime:
+            unchanged.append(path)
+            continue
+        content_hash, mtime = file_fingerprint(path)
+        if not force and doc is not None and doc.content_hash == content_hash:
+            touch_document(path, mtime)
+            unchanged.append(path)
+        else:
+            changed[path] = (content_hash, mtime)
+    return changed, unchanged
+
+def sync_folder(folder="data/legal_pdfs", batch_size=EMBED_BATCH_SIZE, workers=INGEST_WORKERS,
+                pages_per_task=PAGES_PER_TASK, force=False, reindex=False):
+    """Bring legal_chunks in line with the documents in `folder`: ingest new
+    and changed files, drop removed ones, and refresh the indexes and
+    caches that depend on the corpus.
+    Returns (changed, unchanged, removed, total_chunks, total_embedded).
+    """
     create_tables()
-    folder = "data/legal_pdfs"
-    for fname in os.listdir(folder):
-        if fname.lower().endswith((".pdf", ".docx")):
-            print(f"Ingesting: {fname}")
-            ingest_file(os.path.join(folder, fname))
-    print("Ingestion complete!")
\ No newline at end of file
+    paths = [
+        os.path.join(folder, fname)
+        for fname in sorted(os.listdir(folder))
+        if fname.lower().endswith(SUPPORTED_EXTENSIONS)
+    ]
+    manifest = get_document_manifest()
+    changed, unchanged = plan_sync(paths, manifest, force=force)
+
+    # Documents from this folder that are no longer on disk
+    prefix = os.path.join(folder, "")
+    removed = [source for source in manifest
+               if source.startswith(prefix) and source not in paths]
+    for source in removed:
+        print(f"Removing: {os.path.basename(source)}")
+        delete_document(source)
+
+    total_chunks = total_embedded = 0
+    for path, pages in iter_corpus_pages(list(changed), workers=workers,
+                                         pages_per_task=pages_per_task):
+        fname = os.path.basename(path)
+        print(f"Ingesting: {fname}")
+        content_hash, mtime = changed[path]
+        done, embedded = ingest_pages(pages, path, content_hash, mtime,
+                                      batch_size=batch_size,
+                                      progress=print_progress(fname))
+        print(f" ({embedded} newly embedded)")
+        total_chunks += done
+        total_embedded += embedded
+    if reindex or (VECTOR_INDEX_METHOD == "ivfflat" and (changed or removed)):
+        print("Rebuilding vector index...")
+        rebuild_vector_index()
+    if RETRIEVAL_BACKEND == "faiss" and (changed or removed):
+        from utils.faiss_index import export_faiss_index
+        print(f"Exported {export_faiss_index()} chunks to the FAISS index")
+    if changed or removed:
+        # Cached answers were grounded in the old corpus
+        from config.database import SessionLocal
+        from utils.answer_cache import purge
+        with SessionLocal() as db:
+            print(f"Dropped {purge(db)} stale cached answers")
+    return changed, unchanged, removed, total_chunks, total_embedded
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed legal documents into legal_chunks.")
+    parser.add_argument("--folder", default="data/legal_pdfs")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="chunks per embedding batch and multi-row insert")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="extraction processes (1 extracts in this process)")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK)
+    parser.add_argument("--force", action="store_true",
+                        help="re-ingest every file even if unchanged")
+    parser.add_argument("--reindex", action="store_true",
+                        help="rebuild the vector index afterwards (always done for ivfflat when files changed)")
+    args = parser.parse_args()
+
+    started = time.time()
+    changed, unchanged, removed, total_chunks, total_embedded = sync_folder(
+        args.folder, batch_size=args.batch_size, workers=args.workers,
+        pages_per_task=args.pages_per_task, force=args.force, reindex=args.reindex)
+    elapsed = time.time() - started
+    print(f"Ingestion complete! {len(changed)} updated, {len(unchanged)} unchanged, "
+          f"{len(removed)} removed; {total_chunks} chunks ({total_embedded} embedded) "
+          f"in {elapsed:.1f}s")
@@ -2,9 +2,10 @@ from sqlalchemy.orm import Session
 from models.database_models import Query, Feedback
 from datetime import datetime
 import json
+from utils.log_writer import get_log_writer
 
 
-def log_query(db: Session, user_id: str, question: str, response: str, documents_used: list = None, response_time: float = None):
+def log_query(db: Session, user_id: str, question: str, response: str, documents_used: list = None, response_time: float = None, trace: dict = None):
     """Log a query and its response to the database."""
     query = Query(
         user_id=user_id,
@@ -12,6 +13,7 @@ def log_query(db: Session, user_id: str, question: str, response: str, documents
         response=response,
         documents_used=json.dumps(documents_used) if documents_used else None,
         response_time=response_time,
+        trace=json.dumps(trace) if trace else None,
         created_at=datetime.utcnow()
     )
     db.add(query)
@@ -36,11 +38,46 @@ def log_feedback(db: Session, user_id: str, query_id: int, rating: int, is_helpf
     return feedback
 
 
+def queue_query(user_id: str, question: str, response: str, documents_used: list = None, response_time: float = None, trace: dict = None):
+    """log_query without waiting for the database: the row is written in the
+    background by the log writer. Returns the query id reserved for it."""
+    writer = get_log_writer()
+    query_id = writer.next_query_id()
+    writer.enqueue(Query(
+        id=query_id,
+        user_id=user_id,
+        question=question,
+        response=response,
+        documents_used=json.dumps(documents_used) if documents_used else None,
+        response_time=response_time,
+        trace=json.dumps(trace) if trace else None,
+        created_at=datetime.utcnow()
+    ))
+    return query_id
+
+
+def queue_feedback(user_id: str, query_id: int, rating: int, is_helpful: bool, feedback_text: str = None):
+    """log_feedback without waiting for the database (see queue_query)."""
+    get_log_writer().enqueue(Feedback(
+        user_id=user_id,
+        query_id=query_id,
+        rating=rating,
+        is_helpful=is_helpful,
+        feedback_text=feedback_text,
+        created_at=datetime.utcnow()
+    ))
+
+
 def get_user_queries(db: Session, user_id: str, limit: int = 10):
     """Get recent queries for a user."""
     return db.query(Query).filter(Query.user_id == user_id).order_by(Query.created_at.desc()).limit(limit).all()
 
 
+def get_queries_by_ids(db: Session, query_ids: list):
+    """Get queries by id, oldest first."""
+    return db.query(Query).filter(Query.id.in_(query_ids)).order_by(Query.created_at).all()
+
+
 def get_query_feedback(db: Session, query_id: int):
     """Get feedback for a specific query."""
     return db.query(Feedback).filter(Feedback.query_id == query_id).first()
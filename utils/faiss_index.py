@@ -0,0 +1,182 @@
+"""In-process FAISS copy of legal_chunks for retrieval without a database round trip.
+
+Postgres stays the source of truth: export_faiss_index() snapshots every
+chunk into a versioned directory under FAISS_INDEX_DIR and then atomically
+repoints the CURRENT file at it. Readers memory-map the snapshot read-only:
+- the IVF inverted lists live in an on-disk .ivfdata file
+- chunk text is one UTF-8 blob plus an offsets array
+Every process on the host shares the same page-cache copy, and a new
+export is picked up without restarting the app.
+"""
+import os
+import json
+import time
+import shutil
+import threading
+import numpy as np
+import sqlalchemy as sa
+import faiss
+from faiss.contrib.ondisk import merge_ondisk
+
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "data/faiss_index")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+# How often (seconds) readers check CURRENT for a newer export
+FAISS_RELOAD_INTERVAL = float(os.getenv("FAISS_RELOAD_INTERVAL", "30"))
+# Old snapshots kept around for processes that still have them mapped
+FAISS_KEEP_VERSIONS = 2
+
+_CURRENT = "CURRENT"
+_INDEX_FILE = "chunks.faiss"
+_IVFDATA_FILE = "chunks.ivfdata"
+
+
+def _nlist_for(rows):
+    # ~sqrt(n) lists, but keep >= 39 training points per list as FAISS expects
+    return max(1, min(int(rows ** 0.5), rows // 39))
+
+
+def _fetch_chunks(batch_size=2000):
+    """Stream (id, text, source, embedding) rows from legal_chunks."""
+    from utils.vector_db import get_session, LegalChunk
+    session = get_session()
+    try:
+        rows = session.execute(
+            sa.select(LegalChunk.id, LegalChunk.text, LegalChunk.source, LegalChunk.embedding)
+            .order_by(LegalChunk.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for chunk_id, text, source, embedding in rows:
+            yield chunk_id, text, source, embedding
+    finally:
+        session.close()
+
+
+def export_faiss_index(index_dir=FAISS_INDEX_DIR):
+    """Snapshot legal_chunks into a new FAISS version and make it current.
+
+    Returns the number of exported chunks.
+    """
+    ids, offsets, source_idx, vectors = [], [0], [], []
+    sources, source_pos = [], {}
+    # Nanosecond suffix: two exports in the same second must not collide,
+    # and names must still sort by age for _prune_versions
+    now_ns = time.time_ns()
+    version = (time.strftime("%Y%m%d%H%M%S", time.localtime(now_ns // 10**9))
+               + f"{now_ns % 10**9:09d}-{os.getpid()}")
+    target = os.path.join(index_dir, version)
+    os.makedirs(target)
+    try:
+        with open(os.path.join(target, "chunk_text.bin"), "wb") as text_out:
+            for chunk_id, text, source, embedding in _fetch_chunks():
+                data = text.encode("utf-8")
+                text_out.write(data)
+                offsets.append(offsets[-1] + len(data))
+                ids.append(chunk_id)
+                if source not in source_pos:
+                    source_pos[source] = len(sources)
+                    sources.append(source)
+                source_idx.append(source_pos[source])
+                vectors.append(np.asarray(embedding, dtype="float32"))
+        if not vectors:
+            raise ValueError("legal_chunks is empty; nothing to export")
+
+        xb = np.vstack(vectors)
+        np.save(os.path.join(target, "chunk_ids.npy"), np.asarray(ids, dtype="int64"))
+        np.save(os.path.join(target, "chunk_offsets.npy"), np.asarray(offsets, dtype="int64"))
+        np.save(os.path.join(target, "chunk_source_idx.npy"), np.asarray(source_idx, dtype="int32"))
+        with open(os.path.join(target, "sources.json"), "w") as f:
+            json.dump(sources, f)
+
+        # Build in memory, then move the inverted lists to an on-disk file
+        # so readers mmap them instead of loading them.
+        quantizer = faiss.IndexFlatL2(xb.shape[1])
+        index = faiss.IndexIVFFlat(quantizer, xb.shape[1], _nlist_for(len(xb)), faiss.METRIC_L2)
+        index.train(xb)
+        populated = faiss.clone_index(index)
+        populated.add(xb)  # FAISS ids are row positions into the side store
+        block = os.path.join(target, "block.faiss")
+        faiss.write_index(populated, block)
+        merge_ondisk(index, [block], os.path.join(target, _IVFDATA_FILE))
+        faiss.write_index(index, os.path.join(target, _INDEX_FILE))
+        os.remove(block)
+    except Exception:
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(index_dir, _CURRENT + ".tmp")
+    with open(pointer, "w") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(index_dir, _CURRENT))
+    _prune_versions(index_dir, keep=version)
+    return len(ids)
+
+
+def _prune_versions(index_dir, keep):
+    older = sorted(
+        name for name in os.listdir(index_dir)
+        if name != keep and os.path.isdir(os.path.join(index_dir, name))
+    )
+    retained = FAISS_KEEP_VERSIONS - 1
+    stale = older[:len(older) - retained] if retained > 0 else older
+    for version in stale:
+        # Unlinking is safe for processes that still have the files mapped
+        shutil.rmtree(os.path.join(index_dir, version), ignore_errors=True)
+
+
+class FaissRetriever:
+    """Read-only, memory-mapped view of one exported snapshot."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index = faiss.read_index(
+            os.path.join(path, _INDEX_FILE),
+            faiss.IO_FLAG_ONDISK_SAME_DIR | faiss.IO_FLAG_READ_ONLY
+        )
+        self.ids = np.load(os.path.join(path, "chunk_ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "chunk_offsets.npy"), mmap_mode="r")
+        self.source_idx = np.load(os.path.join(path, "chunk_source_idx.npy"), mmap_mode="r")
+        if self.offsets[-1]:
+            self.text = np.memmap(os.path.join(path, "chunk_text.bin"), dtype="uint8", mode="r")
+        else:  # np.memmap refuses empty files
+            self.text = np.zeros(0, dtype="uint8")
+        with open(os.path.join(path, "sources.json")) as f:
+            self.sources = json.load(f)
+
+    def _row(self, pos):
+        text = self.text[self.offsets[pos]:self.offsets[pos + 1]].tobytes().decode("utf-8")
+        return int(self.ids[pos]), text, self.sources[self.source_idx[pos]]
+
+    def search(self, embeddings, k=5, nprobe=None):
+        """Return, per query vector, a list of (id, text, source) tuples."""
+        xq = np.ascontiguousarray(np.atleast_2d(embeddings), dtype="float32")
+        params = faiss.SearchParametersIVF(nprobe=nprobe or FAISS_NPROBE)
+        _, positions = self.index.search(xq, k, params=params)
+        return [[self._row(pos) for pos in row if pos >= 0] for row in positions]
+
+
+_retriever = None
+_retriever_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_retriever(index_dir=FAISS_INDEX_DIR):
+    """Return the process-wide retriever, reloading if a newer export exists.
+
+    Returns None when no index has been exported yet.
+    """
+    global _retriever, _retriever_version, _checked_at
+    now = time.monotonic()
+    if _retriever is not None and now - _checked_at < FAISS_RELOAD_INTERVAL:
+        return _retriever
+    with _lock:
+        _checked_at = now
+        try:
+            with open(os.path.join(index_dir, _CURRENT)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return _retriever
+        if version != _retriever_version:
+            _retriever = FaissRetriever(os.path.join(index_dir, version))
+            _retriever_version = version
+        return _retriever
@@ -0,0 +1,436 @@
+"""Shared chat-completion client for every tool in the app.
+
+One pooled requests.Session keeps TCP+TLS connections to the providers
+alive across questions and Streamlit sessions. Calls try Groq first and
+fall back to OpenAI, with connect/read timeouts and retries on 5xx or
+dropped connections. stream_chat_completion() yields the answer as it is
+generated (server-sent events) for incremental rendering.
+
+Requests to each provider pass through a process-wide token bucket sized
+to its quota (GROQ_RPM / OPENAI_RPM); interactive callers queue ahead of
+bulk work, and a 429 pauses the bucket for the provider's retry-after.
+Identical requests already in flight in this process share one call (and
+one stream) instead of each spending quota.
+
+Providers are routed around with per-provider circuit breakers, so one
+that keeps failing is skipped until it recovers. With LLM_HEDGE=1 a
+request that has not answered within the provider's recent p95 latency
+is also sent to the next provider, and whichever answers first wins.
+Hedges share a small pool (LLM_HEDGE_POOL_SIZE); when it is busy, slow
+requests simply wait for their first provider.
+"""
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from collections import namedtuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from utils.rate_limit import TokenBucket, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from utils.singleflight import SingleFlight
+from utils.provider_health import CircuitBreaker, LatencyTracker
+
+load_dotenv()
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# OpenAI-compatible API roots; point both at benchmarks/llm_stub_server.py
+# to run the app offline.
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+GROQ_API_URL = f"{GROQ_BASE_URL}/chat/completions"
+OPENAI_API_URL = f"{OPENAI_BASE_URL}/chat/completions"
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama3-8b-8192")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+# Keep-alive connections kept open per provider host
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+# Retries per provider on connection errors and 5xx, before falling back
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Requests per minute allowed per provider, and how many may go in a burst
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "5"))
+# Longest a request waits in the rate-limit queue before failing over
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+# Attempts per provider after a 429 before falling back to the next one
+LLM_MAX_429_RETRIES = int(os.getenv("LLM_MAX_429_RETRIES", "3"))
+
+# Send a second provider request when the first is slower than its p95
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+# Hedge delay until a provider has LLM_HEDGE_MIN_SAMPLES latency samples
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "3"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Hedge requests in flight at once; past this, slow requests are not hedged
+LLM_HEDGE_POOL_SIZE = int(os.getenv("LLM_HEDGE_POOL_SIZE", "4"))
+
+Provider = namedtuple("Provider", ["name", "url", "api_key"])
+
+
+class LLMError(Exception):
+    """No provider returned a completion; the message is fit to show users."""
+
+
+class RateLimitTimeout(requests.RequestException):
+    """No rate-limit slot became free within LLM_QUEUE_TIMEOUT."""
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Process-wide requests.Session with a keep-alive pool and retries."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=LLM_MAX_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=frozenset(["POST"]),
+                    raise_on_status=False,
+                    # 429s are handled in _post so the rate limiter sees them
+                    respect_retry_after_header=False,
+                )
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=LLM_POOL_SIZE,
+                                      max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+_completion_flight = SingleFlight("chat_completion")
+_stream_flight = SingleFlight("stream_chat_completion")
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(provider):
+    """The process-wide TokenBucket for `provider`."""
+    bucket = _buckets.get(provider.name)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(provider.name)
+            if bucket is None:
+                rpm = GROQ_RPM if provider.name == "Groq" else OPENAI_RPM
+                bucket = _buckets[provider.name] = TokenBucket(rpm / 60.0, LLM_RATE_BURST)
+    return bucket
+
+
+_breakers = {}
+_latency = {}
+_hedge_stats = {"hedged": 0, "hedge_wins": 0, "hedges_skipped": 0}
+_health_lock = threading.Lock()
+# Only hedges run here; each request's own attempts get their own thread
+_hedge_pool = ThreadPoolExecutor(max_workers=LLM_HEDGE_POOL_SIZE, thread_name_prefix="llm-hedge")
+_hedge_slots = threading.BoundedSemaphore(LLM_HEDGE_POOL_SIZE)
+
+
+def get_breaker(provider):
+    with _health_lock:
+        return _breakers.setdefault(provider.name, CircuitBreaker())
+
+
+def get_latency(provider, stream):
+    """Latency to a usable response: the full answer, or the stream's headers."""
+    with _health_lock:
+        return _latency.setdefault((provider.name, stream), LatencyTracker())
+
+
+def provider_stats():
+    """Breaker state and latency percentiles per provider, plus hedge counters."""
+    stats = {}
+    for provider in configured_providers():
+        breaker = get_breaker(provider)
+        entry = {"breaker": breaker.state, "consecutive_failures": breaker.failures}
+        for stream in (False, True):
+            tracker = get_latency(provider, stream)
+            kind = "stream" if stream else "completion"
+            entry[f"{kind}_p50"] = tracker.percentile(50)
+            entry[f"{kind}_p95"] = tracker.percentile(95)
+            entry[f"{kind}_samples"] = tracker.count()
+        stats[provider.name] = entry
+    with _health_lock:
+        stats.update(_hedge_stats)
+    return stats
+
+
+def _hedge_delay(provider, stream):
+    tracker = get_latency(provider, stream)
+    if tracker.count() < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DELAY
+    return tracker.percentile(95)
+
+
+def _request_key(messages, model, fallback_model, temperature, max_tokens):
+    return json.dumps([messages, model, fallback_model, temperature, max_tokens], sort_keys=True)
+
+
+def _retry_after(response, attempt):
+    """Seconds to wait after a 429: the retry-after header if given, else
+    exponential backoff with jitter."""
+    value = response.headers.get("retry-after")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    return min(2 ** attempt, 30) * (0.5 + random.random() / 2)
+
+
+def configured_providers():
+    """Providers with an API key, in fallback order."""
+    providers = []
+    if GROQ_API_KEY:
+        providers.append(Provider("Groq", GROQ_API_URL, GROQ_API_KEY))
+    if OPENAI_API_KEY:
+        providers.append(Provider("OpenAI", OPENAI_API_URL, OPENAI_API_KEY))
+    return providers
+
+
+def _model_for(provider, model, fallback_model):
+    return model if provider.name == "Groq" else fallback_model
+
+
+def _post(provider, messages, model, temperature, max_tokens, timeout, stream,
+          priority=PRIORITY_INTERACTIVE):
+    """Send one request through the provider's rate limiter, waiting out
+    429s. Returns the final response (possibly still a 429)."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": stream,
+    }
+    bucket = get_bucket(provider)
+    for attempt in range(LLM_MAX_429_RETRIES + 1):
+        if not bucket.acquire(priority, timeout=LLM_QUEUE_TIMEOUT):
+            raise RateLimitTimeout(f"no request slot free after {LLM_QUEUE_TIMEOUT:.0f}s")
+        response = get_http_session().post(
+            provider.url,
+            headers={"Authorization": f"Bearer {provider.api_key}"},
+            json=payload,
+            timeout=timeout or (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT),
+            stream=stream,
+        )
+        if response.status_code != 429 or attempt == LLM_MAX_429_RETRIES:
+            return response
+        bucket.pause(_retry_after(response, attempt))
+        response.close()
+
+
+def chat_completion(messages, model=GROQ_MODEL, fallback_model=OPENAI_MODEL,
+                    temperature=0.2, max_tokens=1000, timeout=None,
+                    priority=PRIORITY_INTERACTIVE):
+    """Return the assistant message for `messages`.
+
+    `model` is used on Groq and `fallback_model` on OpenAI. `priority`
+    orders the request in the rate-limit queue (PRIORITY_INTERACTIVE or
+    PRIORITY_BULK). Raises LLMError if no provider is configured or every
+    provider failed.
+    """
+    key = _request_key(messages, model, fallback_model, temperature, max_tokens)
+    return _completion_flight.do(key, _chat_completion, messages, model, fallback_model,
+                                 temperature, max_tokens, timeout, priority)
+
+
+def _attempt(provider, errors, messages, model, fallback_model, temperature, max_tokens,
+             timeout, stream, priority):
+    """One provider request with breaker and latency bookkeeping.
+
+    Returns the 200 response, or None after appending the failure to `errors`.
+    """
+    breaker = get_breaker(provider)
+    started = time.monotonic()
+    try:
+        response = _post(provider, messages, _model_for(provider, model, fallback_model),
+                         temperature, max_tokens, timeout, stream=stream, priority=priority)
+    except requests.RequestException as e:
+        if not isinstance(e, RateLimitTimeout):
+            breaker.record_failure()
+        errors.append(f"{provider.name} API error: {e}")
+        return None
+    if response.status_code == 200:
+        breaker.record_success()
+        get_latency(provider, stream).record(time.monotonic() - started)
+        return response
+    if response.status_code >= 500:
+        breaker.record_failure()
+    errors.append(f"{provider.name} API error: {response.status_code} {response.text}")
+    response.close()
+    return None
+
+
+def _start_attempt(provider, args):
+    """Run one attempt on a thread of its own and return its Future.
+
+    The request's own attempts are never queued behind other requests'
+    (an attempt can sit in the rate limiter for LLM_QUEUE_TIMEOUT).
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(_attempt(provider, *args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="llm-attempt", daemon=True).start()
+    return future
+
+
+def _start_hedge(provider, args):
+    """Submit a hedge to the bounded hedge pool, or return None when it is full."""
+    if not _hedge_slots.acquire(blocking=False):
+        return None
+    future = _hedge_pool.submit(_attempt, provider, *args)
+    future.add_done_callback(lambda _: _hedge_slots.release())
+    return future
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        future.result().close()
+
+
+def _route(messages, model, fallback_model, temperature, max_tokens, timeout, stream, priority):
+    """Return (provider, response) from the first provider to answer 200.
+
+    Providers with an open breaker are skipped. Without hedging they are
+    tried in order; with LLM_HEDGE the next one is also started whenever
+    the in-flight ones have run past the current provider's p95, unless
+    LLM_HEDGE_POOL_SIZE hedges are already running.
+    """
+    providers = configured_providers()
+    if not providers:
+        raise LLMError("No valid API key found. Please set GROQ_API_KEY or OPENAI_API_KEY in your environment.")
+    queue = [p for p in providers if get_breaker(p).allow()]
+    if not queue:
+        raise LLMError("All LLM providers are failing right now; please try again shortly.")
+
+    errors = []
+    args = (errors, messages, model, fallback_model, temperature, max_tokens, timeout, stream, priority)
+    if not LLM_HEDGE or len(queue) == 1:
+        for provider in queue:
+            response = _attempt(provider, *args)
+            if response is not None:
+                return provider, response
+        raise LLMError("; ".join(errors))
+
+    pending, first, hedged = {}, queue[0], False
+    while queue or pending:
+        if not pending:
+            provider = queue.pop(0)
+            pending[_start_attempt(provider, args)] = provider
+            delay = _hedge_delay(provider, stream)
+        done, _ = wait(pending, timeout=delay if queue else None, return_when=FIRST_COMPLETED)
+        if not done:
+            # Slower than usual: race the next provider against it
+            future = _start_hedge(queue[0], args)
+            if future is None:
+                # Hedge pool saturated; wait this attempt out instead
+                delay = None
+                with _health_lock:
+                    _hedge_stats["hedges_skipped"] += 1
+                continue
+            provider = queue.pop(0)
+            pending[future] = provider
+            delay = _hedge_delay(provider, stream)
+            hedged = True
+            with _health_lock:
+                _hedge_stats["hedged"] += 1
+            continue
+        for future in done:
+            provider = pending.pop(future)
+            response = future.result()
+            if response is not None:
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                if hedged and provider is not first:
+                    with _health_lock:
+                        _hedge_stats["hedge_wins"] += 1
+                return provider, response
+    raise LLMError("; ".join(errors))
+
+
+def _chat_completion(messages, model, fallback_model, temperature, max_tokens, timeout, priority):
+    _, response = _route(messages, model, fallback_model, temperature, max_tokens, timeout,
+                         stream=False, priority=priority)
+    return response.json()["choices"][0]["message"]["content"]
+
+
+class StreamEventError(ValueError):
+    """A server-sent event that is not a completion chunk."""
+
+
+def _iter_sse_deltas(response):
+    """Yield content deltas from an OpenAI-style server-sent event stream.
+
+    Raises StreamEventError for an event that is malformed or reports an
+    error instead of a chunk.
+    """
+    response.encoding = "utf-8"  # event streams often omit the charset
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+            if "error" in event:
+                error = event["error"]
+                raise StreamEventError(error.get("message", error) if isinstance(error, dict) else error)
+            delta = event["choices"][0].get("delta", {}).get("content")
+        except StreamEventError:
+            raise
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            raise StreamEventError(f"malformed event {data[:200]!r}")
+        if delta:
+            yield delta
+
+
+def stream_chat_completion(messages, model=GROQ_MODEL, fallback_model=OPENAI_MODEL,
+                           temperature=0.2, max_tokens=1000, timeout=None,
+                           priority=PRIORITY_INTERACTIVE):
+    """Like chat_completion, but yields the answer in pieces as it arrives.
+
+    Providers are tried in order until one accepts the request; once text
+    has been yielded there is no fallback, and a broken stream raises
+    LLMError.
+    """
+    key = _request_key(messages, model, fallback_model, temperature, max_tokens)
+    return _stream_flight.stream(key, _stream_chat_completion, messages, model, fallback_model,
+                                 temperature, max_tokens, timeout, priority)
+
+
+def _stream_chat_completion(messages, model, fallback_model, temperature, max_tokens, timeout,
+                            priority):
+    provider, response = _route(messages, model, fallback_model, temperature, max_tokens, timeout,
+                                stream=True, priority=priority)
+    with response:
+        try:
+            yield from _iter_sse_deltas(response)
+        except requests.RequestException as e:
+            get_breaker(provider).record_failure()
+            raise LLMError(f"{provider.name} stream interrupted: {e}")
+        except StreamEventError as e:
+            get_breaker(provider).record_failure()
+            raise LLMError(f"{provider.name} stream error: {e}")
@@ -0,0 +1,151 @@
+"""Write-behind logging of queries and feedback.
+
+Chat requests used to commit their Query row (and feedback clicks their
+Feedback row) synchronously on the user-visible path. The LogWriter
+takes ORM objects on a bounded in-memory queue, and one background
+thread inserts them in batches, in arrival order.
+
+Query ids are reserved up front from the table's sequence, in blocks of
+LOG_ID_BLOCK, so a caller knows the id immediately and can attach
+feedback or a cached embedding to it before the row is written. When
+the queue is full, callers wait up to LOG_ENQUEUE_TIMEOUT for room
+rather than writing ahead of the queue, which would break the arrival
+order foreign keys rely on. If the queue is still full after that (the
+database is down or far behind) the row is dropped and counted, the
+same as a batch that fails to insert, so logging never hangs a request.
+Anything still queued is flushed at interpreter exit.
+"""
+import os
+import queue
+import atexit
+import threading
+import sqlalchemy as sa
+from config.database import SessionLocal
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "5000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+# Longest a logged row waits before its batch is written (seconds)
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+# Query ids reserved per sequence round trip
+LOG_ID_BLOCK = int(os.getenv("LOG_ID_BLOCK", "50"))
+# Longest a caller waits for room in a full queue before the row is dropped (seconds)
+LOG_ENQUEUE_TIMEOUT = float(os.getenv("LOG_ENQUEUE_TIMEOUT", "2"))
+
+_STOP = object()
+
+
+class LogWriter:
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.written = 0
+        self.failed = 0
+        self.blocked = 0
+        self.dropped = 0
+        self._ids = []
+        self._ids_lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._in_progress = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def next_query_id(self):
+        """Reserve a queries.id without writing the row."""
+        with self._ids_lock:
+            if not self._ids:
+                with self.session_factory() as db:
+                    self._ids = list(db.execute(sa.text(
+                        "SELECT nextval(pg_get_serial_sequence('queries', 'id')) "
+                        "FROM generate_series(1, :n)"
+                    ), {"n": LOG_ID_BLOCK}).scalars())
+            return self._ids.pop(0)
+
+    def enqueue(self, obj):
+        """Queue an ORM object for insertion, waiting a bounded time while the queue is full."""
+        with self._idle:
+            self._in_progress += 1
+        try:
+            self.queue.put_nowait(obj)
+        except queue.Full:
+            self.blocked += 1
+            try:
+                self.queue.put(obj, timeout=LOG_ENQUEUE_TIMEOUT)  # backpressure keeps rows in order
+            except queue.Full:
+                self.dropped += 1
+                self._done(1)
+                print(f"log writer: queue full for {LOG_ENQUEUE_TIMEOUT}s, dropped {type(obj).__name__}")
+
+    def _done(self, count):
+        with self._idle:
+            self._in_progress -= count
+            self._idle.notify_all()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            try:
+                while len(batch) < LOG_BATCH_SIZE:
+                    item = self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+                    if item is _STOP:
+                        self._write(batch)
+                        self._done(len(batch))
+                        return
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            self._write(batch)
+            self._done(len(batch))
+
+    def _write(self, batch):
+        with self.session_factory() as db:
+            try:
+                db.add_all(batch)
+                db.commit()
+                self.written += len(batch)
+                return
+            except Exception:
+                db.rollback()
+        # Isolate the bad rows so one failure doesn't lose the whole batch
+        for obj in batch:
+            with self.session_factory() as db:
+                try:
+                    db.add(obj)
+                    db.commit()
+                    self.written += 1
+                except Exception as e:
+                    db.rollback()
+                    self.failed += 1
+                    print(f"log writer: dropped {type(obj).__name__}: {e}")
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is written. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_progress == 0, timeout)
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written,
+                "failed": self.failed, "blocked": self.blocked,
+                "dropped": self.dropped}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """The process-wide LogWriter, started on first use and flushed at exit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = LogWriter()
+                atexit.register(_writer.close)
+    return _writer
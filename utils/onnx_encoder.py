@@ -0,0 +1,150 @@
+"""ONNX Runtime drop-in for the SentenceTransformer MiniLM encoder.
+
+Runs an exported (optionally int8-quantized) copy of the model with only
+onnxruntime and tokenizers, so serving processes never import torch.
+export_onnx_encoder.py writes the model files; set EMBEDDING_ENGINE=onnx to
+use them. The ONNX graph includes the transformer only; mean pooling and
+normalisation are done here in numpy, mirroring the SentenceTransformer
+pipeline.
+"""
+import os
+import json
+import numpy as np
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "data/onnx/all-MiniLM-L6-v2")
+# Use the int8 copy when there is one (falls back to fp32 otherwise)
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "1") == "1"
+# Intra-op threads per encode call; 0 lets onnxruntime use every core
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+_MODEL_FILE = "model.onnx"
+_QUANTIZED_MODEL_FILE = "model.int8.onnx"
+_CONFIG_FILE = "encoder_config.json"
+
+PARITY_SENTENCES = [
+    "What are the rights of tenants under the Land Use Act?",
+    "Section 7 of the EFCC Act gives the Commission special powers.",
+    "Every person has a right to life, and no one shall be deprived intentionally of his life.",
+    "A bank shall not carry on banking business in Nigeria without a valid licence.",
+    "Is a marriage valid if it was not celebrated in a licensed place of worship?",
+]
+
+
+class OnnxSentenceEncoder:
+    """Implements the subset of SentenceTransformer.encode the app uses."""
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=ONNX_QUANTIZED, threads=EMBEDDING_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, _CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"],
+                                      pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        if quantized and not os.path.exists(os.path.join(model_dir, _QUANTIZED_MODEL_FILE)):
+            # Exported with --no-quantize: serve the fp32 model instead of failing
+            print(f"{_QUANTIZED_MODEL_FILE} not found in {model_dir}; using {_MODEL_FILE}")
+            quantized = False
+        self.quantized = quantized
+        model_file = _QUANTIZED_MODEL_FILE if quantized else _MODEL_FILE
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, sentences):
+        encodings = self.tokenizer.encode_batch(sentences)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype="int64"),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype="int64"),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype="int64"),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        # Mean pooling over real (non-padding) tokens
+        mask = feeds["attention_mask"][..., None].astype("float32")
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype("float32")
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """Return an (n, dim) float32 array, like SentenceTransformer.encode on a list."""
+        if isinstance(sentences, str):
+            return self.encode([sentences], batch_size)[0]
+        if not sentences:
+            return np.zeros((0, self.config["dimension"]), dtype="float32")
+        # Batch similar lengths together to minimise padding, then restore order
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        output = np.empty((len(sentences), self.config["dimension"]), dtype="float32")
+        for start in range(0, len(sentences), batch_size):
+            idx = order[start:start + batch_size]
+            output[idx] = self._encode_batch([sentences[i] for i in idx])
+        return output
+
+
+def export_onnx(model_name, model_dir=ONNX_MODEL_DIR, quantize=True):
+    """Export a SentenceTransformer's transformer to ONNX (plus an int8 copy).
+
+    Needs torch and sentence-transformers; run it once on a build machine.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(model_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model[0].tokenizer
+    tokenizer.save_pretrained(model_dir)  # writes tokenizer.json for fast tokenizers
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in input_names),
+            os.path.join(model_dir, _MODEL_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"}
+                          for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(os.path.join(model_dir, _MODEL_FILE),
+                         os.path.join(model_dir, _QUANTIZED_MODEL_FILE),
+                         weight_type=QuantType.QInt8)
+
+    pooling = [m for m in st_model if type(m).__name__ == "Pooling"]
+    if pooling and not pooling[0].pooling_mode_mean_tokens:
+        raise ValueError(f"{model_name} does not use mean pooling; the ONNX encoder only supports that")
+    with open(os.path.join(model_dir, _CONFIG_FILE), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "max_seq_length": st_model.max_seq_length,
+            "dimension": st_model.get_sentence_embedding_dimension(),
+            "normalize": any(type(m).__name__ == "Normalize" for m in st_model),
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+        }, f, indent=2)
+    return model_dir
+
+
+def check_parity(reference, candidate, sentences=PARITY_SENTENCES, min_cosine=0.99):
+    """Compare two encoders on `sentences`.
+
+    Returns (ok, worst_cosine): ok is True when every candidate vector has
+    cosine similarity >= min_cosine with the reference vector.
+    """
+    expected = np.asarray(reference.encode(list(sentences)), dtype="float32")
+    actual = np.asarray(candidate.encode(list(sentences)), dtype="float32")
+    cosine = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+    worst = float(cosine.min())
+    return worst >= min_cosine, worst
@@ -0,0 +1,79 @@
+"""Process-wide token-bucket rate limiting with priority ordering.
+
+Each LLM provider gets one bucket shared by every Streamlit session in the
+process. Callers queue for a slot by priority (lower runs first, FIFO
+within a priority), so interactive questions overtake queued bulk work
+such as document reviews. When a provider answers 429, pause() holds the
+whole bucket until its retry-after has passed instead of letting every
+session hammer it.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+class TokenBucket:
+    """`rate` requests per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        # No credit accrues while paused
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Block until a request may be sent. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    at_head = self._waiters[0] == entry
+                    if at_head and now >= self._paused_until and self._tokens >= 1:
+                        self._tokens -= 1
+                        return True
+                    if deadline is not None and now >= deadline:
+                        return False
+                    if at_head:
+                        wait = max(self._paused_until - now, (1 - self._tokens) / self.rate, 0.001)
+                    else:
+                        wait = None  # woken when the head leaves the queue
+                    if deadline is not None:
+                        wait = min(wait or deadline - now, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Stop handing out slots for `seconds` (e.g. a 429 retry-after)."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+            # Resume with a single probe request rather than a burst
+            self._tokens = min(self._tokens, 1.0)
+            self._cond.notify_all()
+
+    def queued(self):
+        with self._cond:
+            return len(self._waiters)
@@ -0,0 +1,151 @@
+"""Persistent exact-match cache of LLM responses for the form-driven tools.
+
+Law Search, Query Builder and Template Builder build deterministic prompts
+from their form fields, so identical submissions can reuse the stored
+answer. Entries are keyed by a hash of (tool, models, messages, params)
+and live in a SQLite file that every session and process shares. They
+expire after RESPONSE_CACHE_TTL_HOURS, and the least recently used ones
+are evicted beyond RESPONSE_CACHE_MAX_ENTRIES. purge_response_cache.py
+clears them. The cache is an optimisation: when the file cannot be read
+or written (locked, read-only filesystem) lookups miss and stores are
+skipped.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from utils.llm_client import (
+    stream_chat_completion, GROQ_MODEL, OPENAI_MODEL, PRIORITY_INTERACTIVE
+)
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "data/response_cache.db")
+RESPONSE_CACHE_TTL_HOURS = float(os.getenv("RESPONSE_CACHE_TTL_HOURS", "720"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+
+_initialised = set()
+
+
+def _connect(path=RESPONSE_CACHE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5)
+    if path not in _initialised:
+        # WAL lets readers in other processes proceed while one writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                        (key TEXT PRIMARY KEY, tool TEXT, response TEXT,
+                         created_at REAL, last_used REAL)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used)")
+        conn.commit()
+        _initialised.add(path)
+    return conn
+
+
+def cache_key(tool, models, messages, params):
+    payload = json.dumps([tool, models, messages, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key, ttl_hours=None):
+    """Return the cached response for `key`, or None if absent, expired or unreadable."""
+    ttl_hours = RESPONSE_CACHE_TTL_HOURS if ttl_hours is None else ttl_hours
+    now = time.time()
+    try:
+        conn = _connect()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Response cache lookup failed: {e}")
+        return None
+    try:
+        row = conn.execute("SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                           (key, now - ttl_hours * 3600)).fetchone()
+        if row is not None:
+            try:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                conn.commit()
+            except sqlite3.Error as e:
+                # Still a hit; only its place in the LRU order is stale
+                print(f"Response cache update failed: {e}")
+        return row[0] if row is not None else None
+    except sqlite3.Error as e:
+        print(f"Response cache lookup failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def put(key, tool, response, max_entries=None):
+    """Store `response` and evict least recently used entries over the limit.
+
+    Errors from the cache file are reported and the store is skipped.
+    """
+    max_entries = RESPONSE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    now = time.time()
+    try:
+        conn = _connect()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Response cache store failed: {e}")
+        return
+    try:
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                     (key, tool, response, now, now))
+        conn.execute('''DELETE FROM responses WHERE key IN
+                        (SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)''',
+                     (max_entries,))
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Response cache store failed: {e}")
+    finally:
+        conn.close()
+
+
+def purge(tool=None, expired_only=False):
+    """Delete cached responses (optionally one tool's, or only expired ones).
+
+    Returns the number of entries removed.
+    """
+    clauses, args = [], []
+    if tool:
+        clauses.append("tool = ?")
+        args.append(tool)
+    if expired_only:
+        clauses.append("created_at < ?")
+        args.append(time.time() - RESPONSE_CACHE_TTL_HOURS * 3600)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = _connect()
+    try:
+        deleted = conn.execute(f"DELETE FROM responses{where}", args).rowcount
+        conn.commit()
+        conn.execute("VACUUM")
+        return deleted
+    finally:
+        conn.close()
+
+
+def cached_stream_chat_completion(tool, messages, model=GROQ_MODEL, fallback_model=OPENAI_MODEL,
+                                  temperature=0.2, max_tokens=1000, timeout=None,
+                                  priority=PRIORITY_INTERACTIVE):
+    """stream_chat_completion with the response cache in front of it.
+
+    A hit yields the stored response in one piece; a miss streams from the
+    provider and stores the answer once it has arrived completely.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        yield from stream_chat_completion(messages, model, fallback_model,
+                                          temperature, max_tokens, timeout, priority)
+        return
+    key = cache_key(tool, [model, fallback_model], messages,
+                    {"temperature": temperature, "max_tokens": max_tokens})
+    cached = get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    for piece in stream_chat_completion(messages, model, fallback_model,
+                                        temperature, max_tokens, timeout, priority):
+        parts.append(piece)
+        yield piece
+    if parts:
+        put(key, tool, "".join(parts))
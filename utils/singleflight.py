@@ -0,0 +1,127 @@
+"""Coalesce identical concurrent calls into one in-flight call.
+
+When many sessions ask the same thing at once, the first caller for a key
+(the leader) does the work and every caller that arrives while it is
+running waits for and shares its result. Streams are broadcast: one
+background thread drains the underlying generator and each caller
+replays the pieces from the start, so a follower that joins late still
+gets the whole answer. Nothing is cached once the call finishes; this
+only flattens bursts.
+"""
+import threading
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Broadcast:
+    def __init__(self):
+        self.pieces = []
+        self.finished = False
+        self.error = None
+        self.cond = threading.Condition()
+
+    def run(self, fn, args, kwargs):
+        try:
+            for piece in fn(*args, **kwargs):
+                with self.cond:
+                    self.pieces.append(piece)
+                    self.cond.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self.cond:
+                self.finished = True
+                self.cond.notify_all()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self.cond:
+                while position == len(self.pieces) and not self.finished:
+                    self.cond.wait()
+                if position == len(self.pieces):
+                    if self.error is not None:
+                        raise self.error
+                    return
+                piece = self.pieces[position]
+            position += 1
+            yield piece
+
+
+class SingleFlight:
+    """One coalescing group; `calls` counts callers, `collapsed` those that
+    shared another caller's in-flight work."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.collapsed = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        with _groups_lock:
+            _groups[name] = self
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), sharing it with concurrent callers of `key`."""
+        with self._lock:
+            self.calls += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.collapsed += 1
+        if leader:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stream(self, key, fn, *args, **kwargs):
+        """Iterate fn(*args, **kwargs), sharing the stream with concurrent callers of `key`."""
+        with self._lock:
+            self.calls += 1
+            broadcast = self._inflight.get(key)
+            if broadcast is None:
+                broadcast = self._inflight[key] = _Broadcast()
+                threading.Thread(target=self._produce, args=(key, broadcast, fn, args, kwargs),
+                                 name=f"singleflight-{self.name}", daemon=True).start()
+            else:
+                self.collapsed += 1
+        return iter(broadcast)
+
+    def _produce(self, key, broadcast, fn, args, kwargs):
+        try:
+            broadcast.run(fn, args, kwargs)
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is broadcast:
+                    del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "collapsed": self.collapsed, "in_flight": len(self._inflight)}
+
+
+def coalescing_stats():
+    """Counters for every coalescing group in the process, by name."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
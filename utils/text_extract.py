@@ -0,0 +1,81 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+import docx2txt
+
+# Kept free of model/database imports so pool workers start cheaply.
+
+# Pages handed to a worker per task; small enough to spread one large Act
+# across several cores, large enough to amortise reopening the PDF.
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "25"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+
+def extract_pdf_pages(pdf_path, start=0, stop=None):
+    """Return the text of pages [start, stop) of a PDF, one string per page."""
+    reader = PdfReader(pdf_path)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def count_pdf_pages(pdf_path):
+    return len(PdfReader(pdf_path).pages)
+
+
+def extract_text_from_pdf(pdf_path):
+    return "\n".join(extract_pdf_pages(pdf_path))
+
+
+def extract_text_from_docx(docx_path):
+    return docx2txt.process(docx_path)
+
+
+def _extract_whole(file_path):
+    """A .docx as a one-page list, so pool results look like PDF page ranges."""
+    return [extract_text_from_docx(file_path)]
+
+
+def iter_document_pages(file_path):
+    """Yield a document's text page by page (a .docx is a single page)."""
+    if file_path.lower().endswith(".pdf"):
+        yield from extract_pdf_pages(file_path)
+    elif file_path.lower().endswith(".docx"):
+        yield extract_text_from_docx(file_path)
+
+
+def _iter_results(futures):
+    for future in futures:
+        yield from future.result()
+
+
+def iter_corpus_pages(file_paths, workers=INGEST_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """Extract many documents in parallel and stream their pages in order.
+
+    Yields (file_path, pages) per document, where `pages` is an iterator
+    that blocks on each page range only when the consumer reaches it. Every
+    document's page ranges are queued on the pool up front, so workers keep
+    extracting later files while the caller chunks and embeds earlier ones.
+    """
+    if workers <= 1:
+        for path in file_paths:
+            yield path, iter_document_pages(path)
+        return
+
+    # Spawn rather than fork: the parent may already hold model threads
+    # and open database connections.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        scheduled = []
+        for path in file_paths:
+            if path.lower().endswith(".pdf"):
+                n_pages = count_pdf_pages(path)
+                futures = [
+                    pool.submit(extract_pdf_pages, path, start, start + pages_per_task)
+                    for start in range(0, n_pages, pages_per_task)
+                ]
+            else:
+                futures = [pool.submit(_extract_whole, path)]
+            scheduled.append((path, futures))
+        for path, futures in scheduled:
+            yield path, _iter_results(futures)
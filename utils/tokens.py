@@ -0,0 +1,82 @@
+"""Cheap token estimates for budgeting prompts.
+
+The providers' tokenizers are not available locally, so counts are an
+estimate: Llama 3 and GPT tokenizers average about four characters per
+token on English legal prose, and never fewer tokens than words.
+"""
+import re
+
+CHARS_PER_TOKEN = 4
+
+_WORD = re.compile(r"\S+")
+
+
+def count_tokens(text):
+    """Approximate number of LLM tokens in `text`."""
+    if not text:
+        return 0
+    return max(-(-len(text) // CHARS_PER_TOKEN), len(_WORD.findall(text)))
+
+
+def split_by_tokens(text, max_tokens):
+    """Split `text` into consecutive pieces of at most ~`max_tokens` tokens.
+
+    Breaks fall on paragraph boundaries where possible, then line breaks,
+    then words, and only a word longer than the budget is cut mid-word,
+    so nothing is dropped, clauses stay together and no piece is over
+    budget.
+    """
+    pieces, current, current_chars, current_words = [], [], 0, 0
+
+    def flush():
+        nonlocal current, current_chars, current_words
+        if current:
+            pieces.append("\n\n".join(current))
+        current, current_chars, current_words = [], 0, 0
+
+    for block in _blocks(text, max_tokens):
+        # count_tokens of the joined piece, including the separators
+        chars = current_chars + len(block) + (2 if current else 0)
+        words = current_words + len(_WORD.findall(block))
+        if current and max(-(-chars // CHARS_PER_TOKEN), words) > max_tokens:
+            flush()
+            chars, words = len(block), len(_WORD.findall(block))
+        current.append(block)
+        current_chars, current_words = chars, words
+    flush()
+    return pieces
+
+
+def _blocks(text, max_tokens):
+    """Yield paragraphs, splitting any that exceed `max_tokens` by lines and then words."""
+    for paragraph in re.split(r"\n\s*\n", text):
+        if not paragraph.strip():
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for line in paragraph.splitlines():
+            if count_tokens(line) <= max_tokens:
+                if line.strip():
+                    yield line
+                continue
+            yield from _split_words(line, max_tokens)
+
+
+def _split_words(line, max_tokens):
+    """Pack the words of `line` into pieces of at most `max_tokens` tokens.
+
+    A word longer than the budget on its own (a URL, or text with no
+    whitespace at all) is cut by character count.
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    current = []
+    for word in line.split():
+        for start in range(0, len(word), max_chars):
+            part = word[start:start + max_chars]
+            if current and count_tokens(" ".join(current + [part])) > max_tokens:
+                yield " ".join(current)
+                current = []
+            current.append(part)
+    if current:
+        yield " ".join(current)
@@ -0,0 +1,154 @@
+"""Lightweight per-request tracing and Prometheus-style metrics.
+
+`with span("search"):` times a stage. The time is added to the trace
+active in the current context (see start_trace), if any, and always to
+the process-wide histogram for that stage. `add_count` records numbers
+such as token counts. A finished trace is a small dict that the chat
+stores on its Query row, and prometheus_text() renders every stage
+histogram and counter in the Prometheus text format.
+Set METRICS_PORT to serve them at /metrics.
+
+Traces follow contextvars, so work handed to other threads (shared
+singleflight streams, hedged requests) is timed by the caller's span
+around it, not inside the thread.
+"""
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_current = contextvars.ContextVar("trace", default=None)
+_metrics_lock = threading.Lock()
+_histograms = {}  # stage -> [bucket counts..., +Inf count, sum]
+_counters = {}
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages = {}
+        self.counts = {}
+
+    def to_dict(self):
+        """Stage timings in milliseconds plus counts, ready to store as JSON."""
+        return {
+            "total_ms": round((time.monotonic() - self.started) * 1000, 2),
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "counts": dict(self.counts),
+        }
+
+
+def start_trace():
+    """Begin a trace for the current request; spans in this context add to it."""
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def finish_trace():
+    """End the current trace and return its to_dict(), or None without one."""
+    trace = _current.get()
+    _current.set(None)
+    return trace.to_dict() if trace is not None else None
+
+
+def _observe(stage, seconds):
+    with _metrics_lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = [0] * (len(LATENCY_BUCKETS) + 2)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as `stage`."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        trace = _current.get()
+        if trace is not None:
+            trace.stages[stage] = trace.stages.get(stage, 0.0) + elapsed
+        _observe(stage, elapsed)
+
+
+def add_count(name, value):
+    """Add `value` to counter `name` on the current trace and process-wide."""
+    trace = _current.get()
+    if trace is not None:
+        trace.counts[name] = trace.counts.get(name, 0) + value
+    with _metrics_lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def prometheus_text(prefix="juristai"):
+    """Stage latency histograms and counters in Prometheus text format."""
+    with _metrics_lock:
+        histograms = {stage: list(values) for stage, values in _histograms.items()}
+        counters = dict(_counters)
+    lines = [f"# HELP {prefix}_stage_seconds Time spent per request stage.",
+             f"# TYPE {prefix}_stage_seconds histogram"]
+    for stage, values in sorted(histograms.items()):
+        for bound, count in zip(LATENCY_BUCKETS, values):
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {values[-2]}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {values[-1]:.6f}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {values[-2]}')
+    for name, value in sorted(counters.items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        data = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on `port` from a daemon thread, once per process.
+    Does nothing when the port is 0 (the default)."""
+    global _server
+    if not port or _server is not None:
+        return
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:  # another worker on this host already serves it
+                print(f"Metrics server not started on port {port}: {e}")
+                _server = False
+                return
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
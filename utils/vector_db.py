@@ -1,17 +1,27 @@
 import os
+import time
+import hashlib
+import threading
+from datetime import datetime
+from itertools import islice
+from collections import OrderedDict
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.dialects.postgresql import VARCHAR
+from sqlalchemy.dialects.postgresql import VARCHAR, TSVECTOR
 from pgvector.sqlalchemy import Vector
 from pgvector.psycopg2 import register_vector
-from sentence_transformers import SentenceTransformer
 import numpy as np
 from dotenv import load_dotenv
+from utils.singleflight import SingleFlight
+from utils.tracing import span
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")  # Your Render PostgreSQL URL
-
-print("DATABASE_URL in use:", DATABASE_URL)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_DIM = 384
+# "torch" runs SentenceTransformer; "onnx" runs the exported ONNX copy
+# (see export_onnx_encoder.py) without importing torch.
+EMBEDDING_ENGINE = os.getenv("EMBEDDING_ENGINE", "torch")
 
 Base = declarative_base()
 
@@ -22,41 +32,639 @@ class LegalChunk(Base):
     text = sa.Column(sa.Text, nullable=False)
     source = sa.Column(VARCHAR(256), nullable=True)
     # 384 for MiniLM, adjust if you use another model
-    embedding = sa.Column(Vector(384))
+    embedding = sa.Column(Vector(EMBEDDING_DIM))
+    # migrate_embeddings.py adds an `embedding_half halfvec` copy of
+    # `embedding`, kept in sync by a trigger. It is deliberately not mapped
+    # here so create_all keeps working on pgvector < 0.7.
+    # sha256 of `text`, lets re-ingestion reuse embeddings of unchanged chunks
+    chunk_hash = sa.Column(VARCHAR(64), index=True)
+    # Maintained by Postgres; GIN-indexed for the lexical half of hybrid search
+    search_tsv = sa.Column(TSVECTOR, sa.Computed("to_tsvector('english', text)", persisted=True))
+
+
+class LegalDocument(Base):
+    """Manifest of ingested source files, used to make ingestion incremental."""
+    __tablename__ = "legal_documents"
+    id = sa.Column(sa.Integer, primary_key=True)
+    source = sa.Column(VARCHAR(256), unique=True, nullable=False)
+    content_hash = sa.Column(VARCHAR(64), nullable=False)  # sha256 of file bytes
+    mtime = sa.Column(sa.Float)
+    chunk_count = sa.Column(sa.Integer)
+    ingested_at = sa.Column(sa.DateTime, default=datetime.utcnow)
+
+
+# The engine and embedding model are process-wide singletons created on
+# first use, so importing this module (and pages that never search) stays
+# cheap. SessionLocal is bound to the engine when it is created.
+SessionLocal = sessionmaker()
+_engine = None
+_model = None
+_engine_lock = threading.Lock()
+_model_lock = threading.Lock()
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+_corpus_version = None
+_corpus_version_at = 0.0
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if DATABASE_URL is None:
+                    raise ValueError("❌ DATABASE_URL is not set. Please check your .env file.")
+                engine = sa.create_engine(DATABASE_URL, pool_pre_ping=True)
+                # Register the vector type with psycopg2 (globally, once)
+                with engine.connect() as conn:
+                    register_vector(conn.connection.dbapi_connection, globally=True)
+                SessionLocal.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+
+def get_session():
+    get_engine()
+    return SessionLocal()
+
 
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if EMBEDDING_ENGINE == "onnx":
+                    from utils.onnx_encoder import OnnxSentenceEncoder
+                    _model = OnnxSentenceEncoder()
+                else:
+                    # Imported here: pulling in torch is most of the load time
+                    from sentence_transformers import SentenceTransformer
+                    _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _model
 
-engine = sa.create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
 
-# Register the vector type with psycopg2
-with engine.connect() as conn:
-    raw_conn = conn.connection
-    register_vector(raw_conn, "vector")
+def warm_up():
+    """Create the engine and load the model now rather than on first search."""
+    get_engine()
+    get_model().encode(["warm up"])
 
-model = SentenceTransformer('all-MiniLM-L6-v2')  # Load model once
+
+def warm_up_in_background():
+    """Start warm_up() once per process on a daemon thread; safe to call on every rerun."""
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_warm_up_quietly, daemon=True)
+            _warm_up_thread.start()
+
+
+def _warm_up_quietly():
+    try:
+        warm_up()
+    except Exception as e:
+        # The first real search will surface the same error to the user
+        print(f"WARNING: embedding warm-up failed: {e}")
+
+
+# Number of chunks embedded per forward pass and inserted per multi-row INSERT
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+
+# Approximate nearest-neighbour index on legal_chunks.embedding.
+# "hnsw" keeps itself up to date as rows are added; "ivfflat" builds faster
+# and smaller but its lists are trained on existing rows, so it must be
+# rebuilt (reindex_vectors.py) after bulk ingestion.
+VECTOR_INDEX_NAME = "ix_legal_chunks_embedding"
+VECTOR_INDEX_METHOD = os.getenv("VECTOR_INDEX_METHOD", "hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))  # 0 = derive from row count
+VECTOR_INDEX_BUILD_MEM = os.getenv("VECTOR_INDEX_BUILD_MEM", "256MB")
+# Per-query recall/speed defaults; higher is slower but more accurate
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+
+# "full" searches the float32 `embedding` column. "half" searches the
+# halfvec `embedding_half` column (half the ANN index size) and re-ranks the
+# top k * RERANK_FACTOR candidates by their full-precision distance.
+# Switch only after running migrate_embeddings.py.
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "full")
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+HALF_VECTOR_INDEX_NAME = "ix_legal_chunks_embedding_half"
+
+# "pgvector" queries Postgres; "faiss" searches the in-process snapshot
+# written by export_faiss_index.py and falls back to Postgres until one exists.
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pgvector")
+
+# "vector" ranks by embedding distance only; "hybrid" also runs a Postgres
+# full-text search and fuses both rankings with reciprocal rank fusion.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Candidates each ranking contributes to the fusion, as a multiple of k
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "4"))
+
+# LRU cache of normalised query -> embedding, shared by all sessions
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+_query_cache_hits = 0
+_query_cache_misses = 0
 
 
 def create_tables():
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(get_engine())
+    # create_all does not alter tables that predate the chunk_hash column
+    with get_engine().begin() as conn:
+        conn.execute(sa.text(
+            "ALTER TABLE legal_chunks ADD COLUMN IF NOT EXISTS chunk_hash VARCHAR(64)"))
+        conn.execute(sa.text(
+            "CREATE INDEX IF NOT EXISTS ix_legal_chunks_chunk_hash ON legal_chunks (chunk_hash)"))
+        conn.execute(sa.text(
+            "ALTER TABLE legal_chunks ADD COLUMN IF NOT EXISTS search_tsv tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', text)) STORED"))
+        conn.execute(sa.text(
+            "CREATE INDEX IF NOT EXISTS ix_legal_chunks_search_tsv ON legal_chunks USING gin (search_tsv)"))
+    # An IVFFlat index trained on an empty table is useless, so only HNSW is
+    # created up front; IVFFlat is built by rebuild_vector_index after ingest.
+    # The halfvec index is built by migrate_embeddings.py.
+    if VECTOR_INDEX_METHOD == "hnsw" and EMBEDDING_STORAGE == "full" \
+            and not vector_index_exists():
+        rebuild_vector_index()
+
+
+def vector_index_exists(name=VECTOR_INDEX_NAME):
+    with get_engine().connect() as conn:
+        return conn.execute(
+            sa.text("SELECT to_regclass(:name) IS NOT NULL"),
+            {"name": name}
+        ).scalar()
+
+
+def _ivfflat_lists(conn):
+    # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond
+    rows = conn.execute(sa.text("SELECT count(*) FROM legal_chunks")).scalar()
+    if rows > 1_000_000:
+        return max(int(rows ** 0.5), 1)
+    return max(rows // 1000, 1)
+
+
+def rebuild_vector_index(method=VECTOR_INDEX_METHOD, m=HNSW_M,
+                         ef_construction=HNSW_EF_CONSTRUCTION, lists=IVFFLAT_LISTS,
+                         maintenance_work_mem=VECTOR_INDEX_BUILD_MEM,
+                         storage=EMBEDDING_STORAGE):
+    """(Re)build the ANN index on the column searched for `storage` without
+    blocking readers.
+
+    The new index is built CONCURRENTLY under a temporary name and then
+    swapped in, so searches keep using the old index until the new one is
+    ready. Returns the CREATE INDEX statement that was run.
+    """
+    if storage == "half":
+        index_name, column = HALF_VECTOR_INDEX_NAME, "embedding_half halfvec_l2_ops"
+    else:
+        index_name, column = VECTOR_INDEX_NAME, "embedding vector_l2_ops"
+    if method == "hnsw":
+        using = f"hnsw ({column}) WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+    elif method == "ivfflat":
+        if not lists:
+            with get_engine().connect() as conn:
+                lists = _ivfflat_lists(conn)
+        using = f"ivfflat ({column}) WITH (lists = {int(lists)})"
+    else:
+        raise ValueError(f"Unknown vector index method: {method}")
+
+    building = f"{index_name}_new"
+    statement = f"CREATE INDEX CONCURRENTLY {building} ON legal_chunks USING {using}"
+    # CONCURRENTLY cannot run inside a transaction block
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(sa.text(f"DROP INDEX IF EXISTS {building}"))
+        conn.execute(sa.text("SELECT set_config('maintenance_work_mem', :mem, false)"),
+                     {"mem": maintenance_work_mem})
+        conn.execute(sa.text(statement))
+    with get_engine().begin() as conn:
+        conn.execute(sa.text(f"DROP INDEX IF EXISTS {index_name}"))
+        conn.execute(sa.text(f"ALTER INDEX {building} RENAME TO {index_name}"))
+    return statement
+
+
+def migrate_to_half_storage(batch_size=5000, progress=None):
+    """Add and backfill legal_chunks.embedding_half (halfvec) from `embedding`.
+
+    The column is added nullable (no table rewrite) and a trigger keeps it
+    in sync for new rows. Existing rows are then backfilled in id batches,
+    one commit per batch, so searches and ingestion keep running. Safe to
+    re-run. Returns the number of rows backfilled.
+    """
+    with get_engine().begin() as conn:
+        conn.execute(sa.text(
+            f"ALTER TABLE legal_chunks ADD COLUMN IF NOT EXISTS embedding_half halfvec({EMBEDDING_DIM})"))
+        conn.execute(sa.text(f"""
+            CREATE OR REPLACE FUNCTION legal_chunks_sync_embedding_half() RETURNS trigger AS $$
+            BEGIN
+                NEW.embedding_half := NEW.embedding::halfvec({EMBEDDING_DIM});
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql"""))
+        conn.execute(sa.text(
+            "DROP TRIGGER IF EXISTS legal_chunks_embedding_half ON legal_chunks"))
+        conn.execute(sa.text(
+            "CREATE TRIGGER legal_chunks_embedding_half "
+            "BEFORE INSERT OR UPDATE OF embedding ON legal_chunks "
+            "FOR EACH ROW EXECUTE FUNCTION legal_chunks_sync_embedding_half()"))
+        max_id = conn.execute(sa.text("SELECT coalesce(max(id), 0) FROM legal_chunks")).scalar()
+
+    done = 0
+    for start in range(0, max_id, batch_size):
+        with get_engine().begin() as conn:
+            done += conn.execute(sa.text(
+                f"UPDATE legal_chunks SET embedding_half = embedding::halfvec({EMBEDDING_DIM}) "
+                "WHERE id > :start AND id <= :stop AND embedding_half IS NULL"
+            ), {"start": start, "stop": start + batch_size}).rowcount
+        if progress:
+            progress(min(start + batch_size, max_id), max_id)
+    return done
+
+
+def drop_full_vector_index():
+    """Drop the float32 ANN index once searches use the halfvec one."""
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(sa.text(f"DROP INDEX CONCURRENTLY IF EXISTS {VECTOR_INDEX_NAME}"))
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
 def add_chunk(text, source=None):
-    embedding = model.encode([text])[0]  # numpy array
-    session = SessionLocal()
+    embedding = get_model().encode([text])[0]  # numpy array
+    session = get_session()
     chunk = LegalChunk(text=text, source=source, embedding=embedding)
     session.add(chunk)
     session.commit()
     session.close()
 
 
-def search_chunks(query, k=5):
-    embedding = model.encode([query])[0]  # numpy array, not list
-    session = SessionLocal()
-    results = session.execute(
-        sa.text(
-            "SELECT id, text, source FROM legal_chunks ORDER BY embedding <-> :embedding LIMIT :k"
-        ),
-        {"embedding": embedding, "k": k}
-    ).fetchall()
-    session.close()
+def _insert_chunks(session, texts, source, batch_size, progress, known=None):
+    """Embed and insert `texts` in batches; returns (inserted, newly_embedded).
+
+    Chunks whose hash is in `known` ({chunk_hash: embedding}) reuse that
+    embedding instead of going through the model.
+    """
+    total = len(texts) if hasattr(texts, "__len__") else None
+    texts = iter(texts)
+    known = known or {}
+    done = embedded = 0
+    while True:
+        batch = list(islice(texts, batch_size))
+        if not batch:
+            break
+        hashes = [chunk_hash(text) for text in batch]
+        missing = [text for text, h in zip(batch, hashes) if h not in known]
+        if missing:
+            for h, embedding in zip(
+                    [h for h in hashes if h not in known],
+                    get_model().encode(missing, batch_size=batch_size)):
+                known[h] = embedding
+            embedded += len(missing)
+        # Executemany on a Core insert is sent as multi-row VALUES
+        session.execute(
+            sa.insert(LegalChunk),
+            [
+                {"text": text, "source": source, "embedding": known[h], "chunk_hash": h}
+                for text, h in zip(batch, hashes)
+            ]
+        )
+        done += len(batch)
+        if progress:
+            progress(done, total)
+    return done, embedded
+
+
+def add_chunks(texts, source=None, batch_size=EMBED_BATCH_SIZE, progress=None):
+    """Embed and insert many chunks in batches, inside a single transaction.
+
+    `texts` may be any iterable (e.g. a streaming chunker); it is consumed one
+    batch at a time. `progress`, if given, is called as progress(done, total)
+    after each batch, with total None when `texts` has no length.
+    """
+    session = get_session()
+    try:
+        done, _ = _insert_chunks(session, texts, source, batch_size, progress)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return done
+
+
+def get_document_manifest():
+    """Return {source: LegalDocument} for every ingested document."""
+    session = get_session()
+    try:
+        return {doc.source: doc for doc in session.query(LegalDocument).all()}
+    finally:
+        session.close()
+
+
+def replace_document(source, content_hash, mtime, texts,
+                     batch_size=EMBED_BATCH_SIZE, progress=None):
+    """Swap a document's chunks for `texts` and record it in the manifest.
+
+    Runs in one transaction, so readers see either the old or the new
+    version. Chunks already stored for `source` keep their embeddings;
+    only new or edited chunks are embedded. Returns (chunks, newly_embedded).
+    """
+    session = get_session()
+    try:
+        known = dict(session.execute(
+            sa.select(LegalChunk.chunk_hash, LegalChunk.embedding)
+            .where(LegalChunk.source == source, LegalChunk.chunk_hash.isnot(None))
+        ).all())
+        session.execute(sa.delete(LegalChunk).where(LegalChunk.source == source))
+        done, embedded = _insert_chunks(session, texts, source, batch_size, progress, known)
+
+        doc = session.query(LegalDocument).filter_by(source=source).one_or_none()
+        if doc is None:
+            doc = LegalDocument(source=source)
+            session.add(doc)
+        doc.content_hash = content_hash
+        doc.mtime = mtime
+        doc.chunk_count = done
+        doc.ingested_at = datetime.utcnow()
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return done, embedded
+
+
+def corpus_version(max_age=60):
+    """Fingerprint of the ingested corpus; changes whenever a document is
+    added, edited or removed. Cached in-process for `max_age` seconds."""
+    global _corpus_version, _corpus_version_at
+    now = time.monotonic()
+    if _corpus_version is None or now - _corpus_version_at > max_age:
+        with get_engine().connect() as conn:
+            _corpus_version = conn.execute(sa.text(
+                "SELECT md5(coalesce(string_agg(source || ':' || content_hash, ',' ORDER BY source), '')) "
+                "FROM legal_documents"
+            )).scalar()
+        _corpus_version_at = now
+    return _corpus_version
+
+
+def touch_document(source, mtime):
+    """Record a new mtime for a document whose content did not change."""
+    session = get_session()
+    try:
+        session.execute(
+            sa.update(LegalDocument).where(LegalDocument.source == source).values(mtime=mtime))
+        session.commit()
+    finally:
+        session.close()
+
+
+def delete_document(source):
+    """Remove a document's chunks and its manifest entry."""
+    session = get_session()
+    try:
+        session.execute(sa.delete(LegalChunk).where(LegalChunk.source == source))
+        session.execute(sa.delete(LegalDocument).where(LegalDocument.source == source))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def normalize_query(query):
+    """Cache key for a query. MiniLM is uncased and ignores spacing, so
+    queries that differ only in case or whitespace embed identically."""
+    return " ".join(query.lower().split())
+
+
+def encode_many(queries):
+    """Embed a list of queries, serving repeats from the LRU cache.
+
+    All cache misses go through the model in a single forward pass.
+    Returns a list of numpy arrays in the order of `queries`.
+    """
+    global _query_cache_hits, _query_cache_misses
+    keys = [normalize_query(q) for q in queries]
+    embeddings = {}
+    with _query_cache_lock:
+        for key in keys:
+            if key in _query_cache:
+                _query_cache.move_to_end(key)
+                embeddings[key] = _query_cache[key]
+                _query_cache_hits += 1
+        missing = [key for key in dict.fromkeys(keys) if key not in embeddings]
+        _query_cache_misses += len(missing)
+    if missing:
+        with span("embed"):
+            vectors = get_model().encode(missing, batch_size=EMBED_BATCH_SIZE)
+        for key, embedding in zip(missing, vectors):
+            embeddings[key] = embedding
+        with _query_cache_lock:
+            for key in missing:
+                _query_cache[key] = embeddings[key]
+                _query_cache.move_to_end(key)
+            while len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    return [embeddings[key] for key in keys]
+
+
+def embed_query(query):
+    return encode_many([query])[0]
+
+
+def query_cache_stats():
+    """Hit/miss counters and current size of the query-embedding cache."""
+    with _query_cache_lock:
+        return {
+            "hits": _query_cache_hits,
+            "misses": _query_cache_misses,
+            "size": len(_query_cache),
+            "max_size": QUERY_CACHE_SIZE,
+        }
+
+
+def clear_query_cache():
+    with _query_cache_lock:
+        _query_cache.clear()
+
+
+_search_flight = SingleFlight("search_chunks")
+
+
+def search_chunks(query, k=5, ef_search=None, probes=None, backend=None, mode=None,
+                  vector_weight=None, lexical_weight=None):
+    """Return the k nearest chunks to `query` as (id, text, source) rows.
+
+    `ef_search` (HNSW) and `probes` (IVFFlat, or nprobe for FAISS) trade
+    speed for recall on this query only; they default to HNSW_EF_SEARCH /
+    IVFFLAT_PROBES / FAISS_NPROBE. `backend` overrides RETRIEVAL_BACKEND.
+    `mode` overrides RETRIEVAL_MODE; in "hybrid" mode the weights scale the
+    vector and lexical rankings' contributions to the fused score.
+
+    Identical searches already in flight in this process are shared
+    rather than repeated.
+    """
+    key = (normalize_query(query), k, ef_search, probes, backend, mode,
+           vector_weight, lexical_weight)
+    with span("search"):
+        rows = _search_flight.do(key, search_chunks_many, [query], k, ef_search, probes,
+                                 backend, mode, vector_weight, lexical_weight)[0]
+    return list(rows)
+
+
+def search_chunks_many(queries, k=5, ef_search=None, probes=None, backend=None, mode=None,
+                       vector_weight=None, lexical_weight=None):
+    """search_chunks for a list of queries: one forward pass for the
+    uncached embeddings and one SQL statement (or one FAISS call) for the
+    lookups. Returns one list of rows per query, in order.
+
+    Hybrid mode always runs in Postgres (FAISS has no lexical index), with
+    one fused statement per query.
+    """
+    if not queries:
+        return []
+    embeddings = encode_many(queries)
+    if (mode or RETRIEVAL_MODE) == "hybrid":
+        return _search_hybrid(
+            queries, embeddings, k, ef_search, probes,
+            HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight,
+            HYBRID_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight)
+    if (backend or RETRIEVAL_BACKEND) == "faiss":
+        from utils.faiss_index import get_retriever
+        retriever = get_retriever()
+        if retriever is not None:
+            return retriever.search(np.vstack(embeddings), k=k, nprobe=probes)
+        print("WARNING: no FAISS index exported yet, searching Postgres instead")
+    return _search_pgvector(embeddings, k, ef_search, probes)
+
+
+def _nearest_sql(vector, limit, columns="id, text, source"):
+    """SQL for the `limit` chunks nearest to the SQL expression `vector`,
+    selecting `columns` plus their full-precision `distance`.
+
+    In "half" storage mode the ANN index on embedding_half picks
+    limit * RERANK_FACTOR candidates, which are then re-ranked by exact
+    float32 distance.
+    """
+    if EMBEDDING_STORAGE == "half":
+        return (
+            f"SELECT {columns}, embedding <-> {vector} AS distance FROM ("
+            f"    SELECT {columns}, embedding FROM legal_chunks"
+            f"    ORDER BY embedding_half <-> CAST({vector} AS halfvec({EMBEDDING_DIM}))"
+            f"    LIMIT {limit} * {RERANK_FACTOR}"
+            f") candidates ORDER BY distance LIMIT {limit}"
+        )
+    return (
+        f"SELECT {columns}, embedding <-> {vector} AS distance FROM legal_chunks "
+        f"ORDER BY distance LIMIT {limit}"
+    )
+
+
+def _index_candidates(k):
+    """Rows the ANN index must return for a top-k search."""
+    return k * RERANK_FACTOR if EMBEDDING_STORAGE == "half" else k
+
+
+def _set_search_params(session, k, ef_search, probes):
+    # is_local=true scopes the settings to this transaction
+    session.execute(
+        sa.text("SELECT set_config('hnsw.ef_search', :ef, true), "
+                "set_config('ivfflat.probes', :probes, true)"),
+        # HNSW returns at most ef_search rows, so never go below k
+        {"ef": str(max(ef_search or HNSW_EF_SEARCH, k)), "probes": str(probes or IVFFLAT_PROBES)}
+    )
+
+
+# Reciprocal rank fusion: score(d) = sum over rankings of weight / (rrf_k + rank(d)).
+# Each ranking is limited to its top candidates before fusing, so both
+# halves stay index scans (HNSW/IVFFlat and GIN).
+def _hybrid_sql():
+    return sa.text(f"""
+WITH vector_hits AS (
+    SELECT id, row_number() OVER (ORDER BY distance) AS rank
+    FROM ({_nearest_sql(":embedding", ":candidates", columns="id")}) v
+),
+lexical_hits AS (
+    SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+    FROM (
+        SELECT id, ts_rank_cd(search_tsv, q) AS score
+        FROM legal_chunks, websearch_to_tsquery('english', :query) q
+        WHERE search_tsv @@ q
+        ORDER BY score DESC LIMIT :candidates
+    ) l
+),
+fused AS (
+    SELECT id, sum(score) AS score
+    FROM (
+        SELECT id, CAST(:vector_weight AS float) / (:rrf_k + rank) AS score FROM vector_hits
+        UNION ALL
+        SELECT id, CAST(:lexical_weight AS float) / (:rrf_k + rank) AS score FROM lexical_hits
+    ) ranked
+    GROUP BY id
+)
+SELECT c.id, c.text, c.source
+FROM fused JOIN legal_chunks c ON c.id = fused.id
+ORDER BY fused.score DESC
+LIMIT :k
+""")
+
+
+def _search_hybrid(queries, embeddings, k, ef_search, probes, vector_weight, lexical_weight):
+    session = get_session()
+    try:
+        candidates = k * HYBRID_CANDIDATE_FACTOR
+        _set_search_params(session, _index_candidates(candidates), ef_search, probes)
+        statement = _hybrid_sql()
+        return [
+            session.execute(statement, {
+                "query": query, "embedding": embedding, "k": k,
+                "candidates": candidates, "rrf_k": RRF_K,
+                "vector_weight": vector_weight, "lexical_weight": lexical_weight,
+            }).fetchall()
+            for query, embedding in zip(queries, embeddings)
+        ]
+    finally:
+        session.close()
+
+
+def _search_pgvector(embeddings, k, ef_search=None, probes=None):
+    session = get_session()
+    try:
+        _set_search_params(session, _index_candidates(k), ef_search, probes)
+        if len(embeddings) == 1:
+            return [session.execute(
+                sa.text(
+                    f"SELECT id, text, source FROM ({_nearest_sql(':embedding', ':k')}) nearest "
+                    "ORDER BY distance"
+                ),
+                {"embedding": embeddings[0], "k": k}
+            ).fetchall()]
+
+        # One index scan per query vector, all in a single round trip
+        rows = session.execute(
+            sa.text(
+                "SELECT q.ord, c.id, c.text, c.source "
+                "FROM unnest(CAST(:embeddings AS vector[])) WITH ORDINALITY AS q(embedding, ord) "
+                f"CROSS JOIN LATERAL ({_nearest_sql('q.embedding', ':k')}) c "
+                "ORDER BY q.ord, c.distance"
+            ),
+            {"embeddings": list(embeddings), "k": k}
+        ).fetchall()
+    finally:
+        session.close()
+    results = [[] for _ in embeddings]
+    for ord_, chunk_id, text, source in rows:
+        results[ord_ - 1].append((chunk_id, text, source))
     return results